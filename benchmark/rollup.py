@@ -0,0 +1,72 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from models import optimize
+
+
+# synthetic input of about n lanes and solution with 30% of lanes unsolved (nan) and 20% at volume 0
+def gen_data(n, seed=0):
+    r = np.random.RandomState(seed)
+    n_supply, n_prod, n_route, n_wh, n_dest = max(1, n // 1000), 50, 3, max(1, n // 100), max(1, n // 200)
+
+    def master(prefix, size):
+        return ['%s%d' % (prefix, x) for x in range(size)]
+
+    supply, prod, route, wh, dest = master('S', n_supply), master('P', n_prod), master('R', n_route), master('W', n_wh), master('D', n_dest)
+    df_dict = {'supply': pd.DataFrame({'supply': supply, 'supply_name': supply, 'supply_lat': r.rand(n_supply), 'supply_long': r.rand(n_supply)}),
+               'product': pd.DataFrame({'prod': prod, 'prod_name': prod}),
+               'route': pd.DataFrame({'route': route, 'route_name': route}),
+               'warehouse': pd.DataFrame({'wh': wh, 'wh_name': wh, 'wh_lat': r.rand(n_wh), 'wh_long': r.rand(n_wh)}),
+               'destination': pd.DataFrame({'dest': dest, 'dest_name': dest, 'dest_lat': r.rand(n_dest), 'dest_long': r.rand(n_dest)}),
+               'supply_param': pd.DataFrame({'supply': supply, 'supply_cap': r.rand(n_supply) * 1e5, 'supply_min': 0.0, 'supply_max': 1.0}),
+               'supplyproduct_param': pd.DataFrame({'supply': supply[:1], 'prod': prod[:1], 'supplyprod_cap': [1e5]}),
+               'warehouse_param': pd.DataFrame({'wh': wh, 'wh_fc': r.rand(n_wh) * 1000, 'wh_min_vol': 0.0, 'wh_max_vol': 1e6})}
+    lanes = pd.DataFrame({'supply': r.choice(supply, n), 'prod': r.choice(prod, n), 'route': r.choice(route, n),
+                          'wh': r.choice(wh, n), 'dest': r.choice(dest, n)}).drop_duplicates(optimize.id_trans).reset_index(drop=True)
+    m = len(lanes)
+    df_dict['supplychain_param'] = lanes.assign(sell_price=r.rand(m) * 10 + 1, var_cost=r.rand(m), trans_cost=r.rand(m))
+    df_dict['logistics_param'] = lanes[['supply', 'route', 'wh', 'dest']].drop_duplicates().assign(logis_cap=1e5, logis_min=0.0, logis_max=1.0)
+    df_dict['demand_param'] = lanes[['prod', 'dest']].drop_duplicates().assign(demand_vol=100.0)
+    df_dict = optimize.prepare_data(df_dict)
+
+    draw = r.rand(m)
+    df_output = lanes.assign(vol=np.where(draw < 0.3, np.nan, np.where(draw < 0.5, 0, r.rand(m) * 100)))
+    df_dict['output_combine'] = pd.merge(df_dict['combine'], df_output, on=optimize.id_trans, how='left')
+    return df_dict
+
+
+# output_rollup with supply netcon and warehouse fixed cost computed row-wise as before column operations
+# column values of output_rollup are replaced, so time of the column operations is included in both
+def rollup_apply(df_dict):
+    rollup = optimize.output_rollup(df_dict)
+    lanes = df_dict['output_combine'].assign(supply_vol=df_dict['output_combine']['vol'].fillna(0))
+    lanes['supply_netcon'] = lanes.apply(lambda x: x['supply_vol']*(x['sell_price']-x['var_cost']-x['trans_cost']), axis=1)
+    df_supply = rollup['supply']
+    df_supply['supply_netcon'] = df_supply['supply'].map(lanes.groupby('supply')['supply_netcon'].sum()).fillna(0)
+    df_supply['supply_netconperunit'] = (df_supply['supply_netcon'] / df_supply['supply_vol']).fillna(0)
+    df_wh = rollup['warehouse']
+    df_wh['wh_fc_val'] = df_wh.apply(lambda x: x['wh_fc'] if x['wh_vol'] > 0 else 0, axis=1)
+    return rollup
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# python -m benchmark.rollup [lanes ...] from directory of config.yaml (default 10000 100000 1000000)
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000]
+    print('%10s %12s %12s %8s' % ('lanes', 'apply_sec', 'column_sec', 'speedup'))
+    for n in sizes:
+        df_dict = gen_data(n)
+        t_apply, old = timeit(rollup_apply, df_dict)
+        t_column, new = timeit(optimize.output_rollup, df_dict)
+        # output_rollup has to give the same supply netcon and warehouse fixed cost as row-wise computation
+        for sheet, col in [('supply', 'supply_netcon'), ('supply', 'supply_netconperunit'), ('warehouse', 'wh_fc_val')]:
+            assert np.allclose(old[sheet][col], new[sheet][col]), '%s %s of output_rollup differs' % (sheet, col)
+        print('%10d %12.4f %12.4f %7.1fx' % (len(df_dict['output_combine']), t_apply, t_column, t_apply / t_column))
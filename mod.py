@@ -1,25 +1,180 @@
 import shutil
 import os
 import io
+import base64
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import zipfile
 
 import yaml
 import numpy as np
+import pandas as pd
 import xlrd
+import xlsxwriter
 from google.cloud import storage
 
+# default name of optional files in config
+file_default = {'cache': 'input_cache.zip',
+                'solution': 'solution.zip',
+                'scenario': 'scenario.xlsx',
+                'status': 'input_status.json'}
+# number of rows of excel sheet, rows over it are left to companion file
+excel_max_row = 1048576
+
+
+class LocalBlob:
+    # blob of LocalBucket with the methods of storage.Blob used by PathFile
+    def __init__(self, name, bucket):
+        self.name = name
+        self.path = os.path.join(bucket.path, *name.split('/'))
+        self.generation = None
+        self.etag = None
+        self.size = None
+
+    def reload(self):
+        stat = os.stat(self.path)
+        self.generation = stat.st_mtime_ns
+        self.etag = '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+
+    def download_to_file(self, file):
+        with open(self.path, 'rb') as f:
+            shutil.copyfileobj(f, file)
+
+    def download_to_filename(self, filename):
+        shutil.copyfile(self.path, filename)
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def upload_from_file(self, file):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        self.reload()
+
+
+class LocalBucket:
+    # bucket backed by local directory for running gcp mode offline
+    def __init__(self, path):
+        self.path = path
+
+    def blob(self, name, chunk_size=None):
+        return LocalBlob(name, self)
+
+    def get_blob(self, name):
+        blob = LocalBlob(name, self)
+        try:
+            blob.reload()
+        except OSError:
+            return None
+        return blob
+
+
+# one storage client and bucket shared by all PathFile in process
+gcp_bucket = {}
+gcp_lock = threading.Lock()
+
+
+def get_bucket(config):
+    with gcp_lock:
+        if 'bucket' not in gcp_bucket:
+            if config.get('fake', 'None') != 'None':
+                gcp_bucket['bucket'] = LocalBucket(config['fake'])
+            else:
+                if config['authfile'] == 'None':
+                    client = storage.Client()
+                else:
+                    client = storage.Client.from_service_account_json(config['authfile'])
+                gcp_bucket['bucket'] = client.get_bucket(config['bucket'])
+        return gcp_bucket['bucket']
+
+
+class BlobCache:
+    # downloaded blobs on local disk keyed by name and generation, least recently used is removed over max_mb
+    def __init__(self, path, max_mb):
+        self.path = path
+        self.max_bytes = max_mb * 1024 ** 2
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, name):
+        return hashlib.sha1(name.encode()).hexdigest()
+
+    def get(self, blob):
+        # path of cached content of blob, download only when generation is not in cache
+        path = os.path.join(self.path, '%s-%s' % (self.key(blob.name), blob.generation))
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        os.close(fd)
+        try:
+            blob.download_to_filename(tmp)
+            self.add(blob, tmp)
+        except Exception:
+            os.remove(tmp)
+            raise
+        return path
+
+    def put(self, blob, file):
+        # cache content of uploaded file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        self.add(blob, tmp)
+
+    def add(self, blob, tmp):
+        key = self.key(blob.name)
+        with self.lock:
+            for x in os.listdir(self.path):
+                if x.startswith(key + '-'):
+                    try:
+                        os.remove(os.path.join(self.path, x))
+                    except OSError:
+                        pass
+            os.replace(tmp, os.path.join(self.path, '%s-%s' % (key, blob.generation)))
+            self.evict('%s-%s' % (key, blob.generation))
+
+    def evict(self, keep):
+        # keep file just added, cache directory can be shared by other processes, files removed by them are skipped
+        files = []
+        for x in os.listdir(self.path):
+            try:
+                stat = os.stat(os.path.join(self.path, x))
+            except OSError:
+                continue
+            if not x.endswith('.tmp') and x != keep:
+                files.append((stat.st_mtime, stat.st_size, x))
+        total = sum(x[1] for x in files) + os.path.getsize(os.path.join(self.path, keep))
+        for _, size, x in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, x))
+            except OSError:
+                pass
+            total -= size
+
 
 class PathFile:
     def __init__(self):
         with open("config.yaml") as f:
             self.config = yaml.load(f, Loader=yaml.Loader)
-            # gcp client
+            for key, val in file_default.items():
+                self.config['file'].setdefault(key, val)
+            # files written in memory up to spool_mb, then in temp file
+            self.spool_size = int(self.config['app'].get('spool_mb', 16) * 1024 ** 2)
+            # gcp bucket shared by process, downloaded files cached on local disk
             if self.config['app']['run'] == "gcp":
-                if self.config['path']['gcp']['authfile'] == 'None':
-                    client = storage.Client()
-                else:
-                    client = storage.Client.from_service_account_json(
-                        self.config['path']['gcp']['authfile'])
-                self.gcpbucket = client.get_bucket(self.config['path']['gcp']['bucket'])
+                # resumable transfer in chunks, multiple of 256 KB
+                self.chunk_size = int(self.config['path']['gcp'].get('chunk_mb', 8) * 4) * 256 * 1024
+                self.gcpbucket = get_bucket(self.config['path']['gcp'])
+                self.gcpcache = BlobCache(self.config['path']['gcp'].get('cache', os.path.join('tmp', 'gcs_cache')),
+                                          self.config['path']['gcp'].get('cache_mb', 512))
             else:
                 pass
 
@@ -28,7 +183,7 @@ class PathFile:
         # load file from GCP
         if self.config['app']['run'] == "gcp":
             fullpath = '/'.join((self.config['path']['gcp']['path'], filename))
-            blob = storage.Blob(fullpath, self.gcpbucket)
+            blob = self.gcpbucket.blob(fullpath)
             byte_stream = io.BytesIO()
             blob.download_to_file(byte_stream)
             byte_stream.seek(0)
@@ -44,26 +199,45 @@ class PathFile:
     def setuser(self, user):
         self.user = user
 
+    def tempfile(self):
+        # file to write output before save, in memory until spool_size
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
     def loadfile(self, filename):
-        # load file from GCP
+        # load file from GCP, opened file of local copy in cache
         if self.config['app']['run'] == "gcp":
             fullpath = '/'.join((self.config['path']['gcp']['path'], self.user, filename))
-            blob = storage.Blob(fullpath, self.gcpbucket)
-            byte_stream = io.BytesIO()
-            blob.download_to_file(byte_stream)
-            byte_stream.seek(0)
-            return byte_stream
+            blob = self.gcpbucket.get_blob(fullpath)
+            if blob is None:
+                raise FileNotFoundError(fullpath)
+            blob.chunk_size = self.chunk_size
+            return open(self.gcpcache.get(blob), 'rb')
         # load file from local
         else:
             path = os.path.join(self.config['path']['local']['path'], self.user, filename)
             return path
 
+    def version(self, filename):
+        # generation of file in GCP or modified time of local file, None if file does not exist
+        if self.config['app']['run'] == "gcp":
+            fullpath = '/'.join((self.config['path']['gcp']['path'], self.user, filename))
+            blob = self.gcpbucket.get_blob(fullpath)
+            return None if blob is None else blob.generation
+        else:
+            path = os.path.join(self.config['path']['local']['path'], self.user, filename)
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+
     def savefile(self, file, filename):
         # save file to GCP
         if self.config['app']['run'] == "gcp":
             fullpath = '/'.join((self.config['path']['gcp']['path'], self.user, filename))
-            blob = storage.Blob(fullpath, self.gcpbucket)
+            blob = self.gcpbucket.blob(fullpath, chunk_size=self.chunk_size)
             blob.upload_from_file(file)
+            file.seek(0)
+            self.gcpcache.put(blob, file)
         # save file to local
         else:
             path = os.path.join(self.config['path']['local']['path'], self.user, filename)
@@ -71,12 +245,11 @@ class PathFile:
                 shutil.copyfileobj(file, f)
 
 
-def converttofloat(x):
-    try:
-        X = float(x)
-    except Exception:
-        X = np.nan
-    return X
+def timed(timing, name, start):
+    # add seconds since start to phase of timing, return current time as start of next phase
+    end = time.time()
+    timing[name] = round(timing.get(name, 0) + end - start, 3)
+    return end
 
 
 def write_dict_to_worksheet(x, sheetname, workbook):
@@ -88,6 +261,47 @@ def write_dict_to_worksheet(x, sheetname, workbook):
         row += 1
 
 
+def workbook(file):
+    # constant_memory workbook keeps one row in memory, rows of each sheet have to be written in order
+    return xlsxwriter.Workbook(file, {'constant_memory': True})
+
+
+def sheet_rows(df, columns, chunk):
+    # rows of columns as python values in chunks, nan as blank cell and inf as text like to_excel
+    for i in range(0, len(df), chunk):
+        values = []
+        for col in columns:
+            val = df[col].values[i:i + chunk]
+            out = val.astype(object)
+            out[pd.isna(val)] = None
+            if val.dtype.kind == 'f':
+                out[np.isposinf(val)] = 'inf'
+                out[np.isneginf(val)] = '-inf'
+            values.append(out)
+        yield from zip(*values)
+
+
+def write_df_to_worksheet(df, sheetname, workbook, columns=None, chunk=10000):
+    # header and rows written in order for constant_memory workbook, rows over excel limit are not written
+    columns = list(df.columns) if columns is None else columns
+    worksheet = workbook.add_worksheet(sheetname)
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, columns, header)
+    for row, values in enumerate(sheet_rows(df.iloc[:excel_max_row - 1], columns, chunk), 1):
+        worksheet.write_row(row, 0, values)
+
+
+def write_table(df, fmt, file, chunk=100000):
+    # dataframe as csv or parquet file
+    if fmt == 'parquet':
+        df.to_parquet(file, index=False)
+    else:
+        for i in range(0, len(df), chunk):
+            file.write(df.iloc[i:i + chunk].to_csv(index=False, header=i == 0).encode())
+    file.seek(0)
+    return file
+
+
 def read_dict_from_worksheet(file, sheet, stream=False):
     if stream:
         ws = xlrd.open_workbook(file_contents=file.read()).sheet_by_name(sheet)
@@ -102,3 +316,48 @@ def read_dict_from_worksheet(file, sheet, stream=False):
             break
         row += 1
     return status
+
+
+def write_json(x):
+    return io.BytesIO(json.dumps(x).encode())
+
+
+def read_json(file):
+    # file is local path or opened file
+    if isinstance(file, str):
+        with open(file) as f:
+            return json.load(f)
+    with file as f:
+        return json.load(f)
+
+
+def decode_to_file(content, file, chunk=4 * 1024 ** 2):
+    # decode base64 string to file in chunks, return sha256 of decoded content
+    sha = hashlib.sha256()
+    for i in range(0, len(content), chunk):
+        data = base64.b64decode(content[i:i + chunk])
+        sha.update(data)
+        file.write(data)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def write_frames(df_dict, manifest, file=None):
+    # bundle dataframes as feather files with json manifest in one zip file
+    file = io.BytesIO() if file is None else file
+    with zipfile.ZipFile(file, 'w') as z:
+        z.writestr('manifest.json', json.dumps(manifest))
+        for name, df in df_dict.items():
+            buffer = io.BytesIO()
+            df.reset_index(drop=True).to_feather(buffer)
+            z.writestr(name + '.feather', buffer.getvalue())
+    file.seek(0)
+    return file
+
+
+def read_frames(file):
+    with zipfile.ZipFile(file) as z:
+        manifest = json.loads(z.read('manifest.json'))
+        df_dict = {x[:-len('.feather')]: pd.read_feather(io.BytesIO(z.read(x)))
+                   for x in z.namelist() if x.endswith('.feather')}
+    return manifest, df_dict
@@ -0,0 +1,145 @@
+import os
+import json
+import zlib
+import sqlite3
+import threading
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from pytz import timezone
+
+from models import optimize, scenario
+import mod
+
+p = mod.PathFile()
+job_config = p.config.get('job', {})
+job_db = job_config.get('db', os.path.join('tmp', 'job.db'))
+job_worker = job_config.get('worker', 2)
+job_active = ['queued', 'running']
+# columns added after the first version of job table, kind of job (solve or scenario) and solver option profile
+job_column = {'kind': "TEXT DEFAULT 'solve'", 'profile': "TEXT DEFAULT 'default'"}
+job_schema = False
+# one single process executor per worker, number of queued and running jobs of each worker
+# and worker that ran last job of each user, which keeps its cached model
+executor = {}
+worker_job = {}
+worker_user = {}
+worker_lock = threading.Lock()
+
+
+def now():
+    return datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def connect():
+    global job_schema
+    con = sqlite3.connect(job_db, timeout=30)
+    con.row_factory = sqlite3.Row
+    # create table and add columns missing in job table of older version, once in each process
+    if not job_schema:
+        with con:
+            con.execute("""CREATE TABLE IF NOT EXISTS job (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           user TEXT, solve_engine TEXT, status TEXT, pid INTEGER,
+                           submit_time TEXT, start_time TEXT, end_time TEXT, result TEXT)""")
+            column = [x['name'] for x in con.execute("PRAGMA table_info(job)")]
+        for name, definition in job_column.items():
+            if name not in column:
+                # column can be added by other process at the same time
+                try:
+                    with con:
+                        con.execute("ALTER TABLE job ADD COLUMN %s %s" % (name, definition))
+                except sqlite3.OperationalError:
+                    pass
+        job_schema = True
+    return con
+
+
+def update(job_id, **kwargs):
+    con = connect()
+    with con:
+        con.execute("UPDATE job SET %s WHERE id = ?" % ', '.join('%s = ?' % k for k in kwargs),
+                    list(kwargs.values()) + [job_id])
+    con.close()
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def get(user):
+    # latest job of user, jobs left active by a dead process are marked as error
+    con = connect()
+    row = con.execute("SELECT * FROM job WHERE user = ? ORDER BY id DESC LIMIT 1", (user,)).fetchone()
+    con.close()
+    if row is None:
+        return None
+    job = dict(row)
+    if job['status'] in job_active and not alive(job['pid']):
+        job['status'] = 'error'
+        job['result'] = json.dumps({'error': 'job process stopped'})
+        update(job['id'], status=job['status'], result=job['result'])
+    job['result'] = json.loads(job['result']) if job['result'] else {}
+    return job
+
+
+def pick_worker(user):
+    # worker of user when it is idle, otherwise any idle worker, worker of user when all workers are busy
+    home = worker_user.get(user, zlib.crc32(user.encode()) % job_worker)
+    idle = [x for x in range(job_worker) if worker_job.get(x, 0) == 0]
+    if home in idle or not idle:
+        return home
+    return idle[0]
+
+
+def submit(user, solve_engine, kind='solve', profile='default'):
+    # one active job per user, return the running one instead of queueing another
+    job = get(user)
+    if job is not None and job['status'] in job_active:
+        return job['id']
+    with worker_lock:
+        worker = pick_worker(user)
+        if worker not in executor:
+            executor[worker] = ProcessPoolExecutor(max_workers=1)
+        worker_job[worker] = worker_job.get(worker, 0) + 1
+        worker_user[user] = worker
+    con = connect()
+    with con:
+        cur = con.execute("INSERT INTO job (user, solve_engine, kind, profile, status, pid, submit_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (user, solve_engine, kind, profile, 'queued', os.getpid(), now()))
+    con.close()
+    job_id = cur.lastrowid
+
+    # mark job as error if the worker process dies before finishing it
+    def failed(future):
+        error = future.exception()
+        with worker_lock:
+            worker_job[worker] -= 1
+            if error is not None:
+                executor.pop(worker, None)
+        if error is not None:
+            update(job_id, status='error', end_time=now(), result=json.dumps({'error': str(error)}))
+
+    executor[worker].submit(run, job_id, user, solve_engine, kind, profile).add_done_callback(failed)
+    return job_id
+
+
+def run(job_id, user, solve_engine, kind='solve', profile='default'):
+    update(job_id, status='running', start_time=now())
+    try:
+        if kind == 'scenario':
+            update(job_id, status='done', end_time=now(), result=json.dumps(scenario.run(user, solve_engine, profile)))
+            return
+        opt = optimize.Optimize(user)
+        opt.import_data()
+        opt_status = opt.optimize(solve_engine=solve_engine, profile=profile)
+        # incumbent of solve stopped by limit is exported with its gap
+        opt.gen_output(opt_status)
+        opt.gen_plot(opt_status)
+        update(job_id, status='done', end_time=now(), result=json.dumps(opt_status))
+    except Exception as e:
+        update(job_id, status='error', end_time=now(), result=json.dumps({'error': str(e)}))
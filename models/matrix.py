@@ -0,0 +1,368 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import highspy
+
+import mod
+
+id_trans = ['supply', 'prod', 'route', 'wh', 'dest']
+executable = {'cbc': 'cbc', 'glpk': 'glpsol'}
+
+
+def group_rows(lanes, keys, param, cols, default):
+    # row of each lane grouped by keys and param values of each row (default if not in param)
+    row = lanes.groupby(keys, sort=False).ngroup().values
+    group = lanes[keys].drop_duplicates()
+    value = pd.merge(group, param[keys + cols].drop_duplicates(keys), on=keys, how='left')
+    return row, len(group), [value[c].fillna(d).values for c, d in zip(cols, default)]
+
+
+def build(df_dict, wh_fixed=(), link=None):
+    # sparse constraint matrix, bounds and objective of the model, wh_decision of wh_fixed is fixed at 1
+    # link is bound of warehouses and of (wh, prod, dest) with own linking row for tightened big-M, None for total demand
+    # columns: trans_vol of each lane, wh_decision of each warehouse
+    # rows: supply min/max, supply product cap, logistics min/max, demand, warehouse decision, warehouse min/max, warehouse demand linking
+    lanes = df_dict['supplychain_param'][id_trans + ['sell_price', 'var_cost', 'trans_cost']].reset_index(drop=True)
+    n = len(lanes)
+    wh = list(lanes['wh'].drop_duplicates())
+    max_vol = df_dict['demand_param']['demand_vol'].sum()
+    lane = np.arange(n)
+    rows, cols, vals, row_lb, row_ub = [], [], [], [], []
+
+    def add_rows(row, n_row, lb, ub):
+        offset = sum(len(x) for x in row_lb)
+        rows.append(row + offset)
+        cols.append(lane)
+        vals.append(np.ones(n))
+        row_lb.append(lb * np.ones(n_row))
+        row_ub.append(ub * np.ones(n_row))
+        return offset
+
+    # supply min/max
+    row, n_row, (lb, ub) = group_rows(lanes, ['supply'], df_dict['supply_param'], ['supply_min_vol', 'supply_max_vol'], [0, 0])
+    add_rows(row, n_row, lb, ub)
+    # supply product cap
+    row, n_row, (ub,) = group_rows(lanes, ['supply', 'prod'], df_dict['supplyproduct_param'], ['supplyprod_cap'], [10000000])
+    add_rows(row, n_row, -np.inf, ub)
+    # logistics min/max
+    row, n_row, (lb, ub) = group_rows(lanes, ['supply', 'route', 'wh', 'dest'], df_dict['logistics_param'],
+                                      ['logis_min_vol', 'logis_max_vol'], [0, 1000000000])
+    add_rows(row, n_row, lb, ub)
+    # demand
+    row, n_row, (vol,) = group_rows(lanes, ['prod', 'dest'], df_dict['demand_param'], ['demand_vol'], [0])
+    add_rows(row, n_row, vol, vol)
+    # warehouse decision, min/max
+    row, n_row, (wh_min, wh_max, wh_fc) = group_rows(lanes, ['wh'], df_dict['warehouse_param'],
+                                                     ['wh_min_vol', 'wh_max_vol', 'wh_fc'], [0, 1000000000, 1000000000])
+    offset = add_rows(row, n_row, -np.inf, 0)
+    rows.append(offset + np.arange(n_row))
+    cols.append(n + np.arange(n_row))
+    vals.append(-max_vol * np.ones(n_row) if link is None else -np.array([link[0][x] for x in wh]))
+    add_rows(row, n_row, wh_min, wh_max)
+    # warehouse demand linking, rows of linked (wh, prod, dest) only
+    if link is not None and len(link[1]) > 0:
+        wh_row = row
+        keys = ['wh', 'prod', 'dest']
+        group = lanes.groupby(keys, sort=False).ngroup().values
+        bound = np.array([link[1].get(x, np.nan) for x in lanes[keys].drop_duplicates().itertuples(index=False, name=None)])
+        linked = ~np.isnan(bound)
+        j = np.nonzero(linked[group])[0]
+        offset = sum(len(x) for x in row_lb)
+        link_row = offset + np.cumsum(linked) - 1
+        rows.extend([link_row[group[j]], link_row[linked]])
+        cols.extend([j, n + wh_row[np.unique(group, return_index=True)[1]][linked]])
+        vals.extend([np.ones(len(j)), -bound[linked]])
+        row_lb.append(-np.inf * np.ones(linked.sum()))
+        row_ub.append(np.zeros(linked.sum()))
+
+    row_lb = np.concatenate(row_lb)
+    A = sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(row_lb), n + len(wh))).tocsc()
+    margin = (lanes['sell_price'] - lanes['var_cost'] - lanes['trans_cost']).values
+    return {'lanes': lanes[id_trans], 'wh': wh, 'A': A,
+            'row_lb': row_lb, 'row_ub': np.concatenate(row_ub),
+            'c': np.concatenate([margin, -wh_fc]),
+            'col_lb': np.concatenate([np.zeros(n), np.isin(wh, list(wh_fixed)).astype(float)]),
+            'col_ub': np.concatenate([np.inf * np.ones(n), np.ones(len(wh))]),
+            'integer': np.concatenate([np.zeros(n, dtype=bool), np.ones(len(wh), dtype=bool)])}
+
+
+def count(lp):
+    # size of model
+    return {'model_variables': lp['A'].shape[1],
+            'model_binaries': int((lp['integer'] & (lp['col_lb'] == 0)).sum()),
+            'model_constraints': lp['A'].shape[0],
+            'model_nonzeros': lp['A'].nnz}
+
+
+def col_name(lp, j):
+    return 'x%i' % j if j < len(lp['lanes']) else 'y%i' % (j - len(lp['lanes']))
+
+
+def write_mps(lp, path):
+    # free MPS, maximize objective written as minimize of negative objective
+    # cbc reads free format only when NAME record is marked FREE
+    A = lp['A']
+    n_row = A.shape[0]
+    row_type = np.where(lp['row_lb'] == lp['row_ub'], 'E',
+                        np.where(np.isinf(lp['row_lb']), 'L', 'G'))
+    with open(path, 'w') as f:
+        f.write('NAME supply FREE\nROWS\n N obj\n')
+        f.writelines(' %s r%i\n' % (t, i) for i, t in enumerate(row_type))
+        f.write('COLUMNS\n')
+        integer = False
+        for j in range(A.shape[1]):
+            if lp['integer'][j] != integer:
+                integer = lp['integer'][j]
+                f.write(" M%i 'MARKER' '%s'\n" % (j, 'INTORG' if integer else 'INTEND'))
+            name = col_name(lp, j)
+            if lp['c'][j] != 0:
+                f.write(' %s obj %.17g\n' % (name, -lp['c'][j]))
+            start, end = A.indptr[j], A.indptr[j + 1]
+            f.writelines(' %s r%i %.17g\n' % (name, i, v) for i, v in zip(A.indices[start:end], A.data[start:end]))
+        if integer:
+            f.write(" M%i 'MARKER' 'INTEND'\n" % A.shape[1])
+        f.write('RHS\n')
+        rhs = np.where(row_type == 'L', lp['row_ub'], lp['row_lb'])
+        f.writelines(' rhs r%i %.17g\n' % (i, rhs[i]) for i in range(n_row) if rhs[i] != 0)
+        ranged = (row_type == 'G') & ~np.isinf(lp['row_ub'])
+        f.write('RANGES\n')
+        f.writelines(' rng r%i %.17g\n' % (i, lp['row_ub'][i] - lp['row_lb'][i]) for i in np.nonzero(ranged)[0])
+        f.write('BOUNDS\n')
+        f.writelines(' FX bnd %s 1\n' % col_name(lp, j) if lp['col_lb'][j] > 0 else ' BV bnd %s\n' % col_name(lp, j)
+                     for j in np.nonzero(lp['integer'])[0])
+        f.write('ENDATA\n')
+
+
+def mip_gap(bound, objective):
+    # relative gap between best bound and objective of incumbent, None if bound is unknown
+    if bound is None or objective is None or not np.isfinite(bound):
+        return None
+    return round(abs(bound - objective) / max(abs(objective), 1e-10), 6)
+
+
+def feasible(lp, x, tol=1e-6):
+    # solution is within row and column bounds and binaries are integer, relative tolerance for large rows
+    # cbc may write solution that is not feasible when it is stopped by limit
+    ax = lp['A'] @ x
+    scale = tol * np.maximum(1, np.abs(ax))
+    binary = x[lp['integer']]
+    return bool(np.all(ax >= lp['row_lb'] - scale) and np.all(ax <= lp['row_ub'] + scale)
+                and np.all(x >= lp['col_lb'] - tol) and np.all(x <= lp['col_ub'] + tol)
+                and np.all(np.abs(binary - np.round(binary)) <= tol))
+
+
+def read_cbc(path, lp):
+    # first line is status, then index, name, value, reduced cost of nonzero columns
+    x = np.zeros(lp['A'].shape[1])
+    with open(path) as f:
+        header = f.readline()
+        for line in f:
+            name, value = line.split()[-3:-1]
+            x[int(name[1:]) + (len(lp['lanes']) if name[0] == 'y' else 0)] = float(value)
+    condition = header.split(' - ')[0].strip().lower()
+    if condition.startswith('optimal'):
+        return 'ok', 'optimal', x
+    elif 'infeasible' in condition:
+        return 'warning', 'infeasible', None
+    elif condition.startswith('stopped'):
+        # stopped by limit keeps incumbent, continuous solution is not used when there is no integer solution
+        return 'aborted', condition.split(' (')[0], None if 'no integer' in condition else x
+    return 'warning', condition, None
+
+
+def read_cbc_bound(path):
+    # best bound of maximize objective from cbc log, lower bound of minimize log of mps is negated, None if cbc did not report it
+    with open(path) as f:
+        bound = re.findall(r'(Lower|Upper) bound:\s+(\S+)', f.read())
+    if not bound:
+        return None
+    return -float(bound[-1][1]) if bound[-1][0] == 'Lower' else float(bound[-1][1])
+
+
+def read_glpk(path, lp):
+    # glpk plain text solution, "s mip <rows> <cols> <status> <obj>" and "j <col> <value>"
+    x = np.zeros(lp['A'].shape[1])
+    status = 'u'
+    with open(path) as f:
+        for line in f:
+            token = line.split()
+            if token[:1] == ['s']:
+                status = token[4]
+            elif token[:1] == ['j']:
+                x[int(token[1]) - 1] = float(token[2])
+    if status == 'o':
+        return 'ok', 'optimal', x
+    elif status == 'n':
+        return 'warning', 'infeasible', None
+    elif status == 'f':
+        return 'ok', 'feasible', x
+    return 'warning', 'other', None
+
+
+def read_glpk_bound(path):
+    # best bound of maximize objective from last "mip = <obj> <= <bound>" line of glpsol log, bound of minimize log (>=) is negated
+    # None if tree is empty
+    with open(path) as f:
+        bound = re.findall(r'mip =\s+\S+\s+([<>])=\s+(\S+)', f.read())
+    try:
+        return -float(bound[-1][1]) if bound[-1][0] == '>' else float(bound[-1][1])
+    except (IndexError, ValueError):
+        return None
+
+
+# best bound from log of solver executable
+read_bound = {'cbc': read_cbc_bound, 'glpk': read_glpk_bound}
+
+
+def write_mipstart(lp, path, start):
+    # cbc mip start, index name value of integer columns with nonzero value
+    wh_open = set(start['wh'].loc[start['wh']['wh_decision'] > 0, 'wh'])
+    with open(path, 'w') as f:
+        f.writelines('%i y%i 1\n' % (len(lp['lanes']) + i, i) for i, x in enumerate(lp['wh']) if x in wh_open)
+
+
+def start_values(lp, start):
+    # value of every column from previous solution, lanes and warehouses not in previous solution are 0
+    trans_vol = pd.merge(lp['lanes'], start['trans'], on=id_trans, how='left')['vol'].fillna(0).values
+    wh_open = set(start['wh'].loc[start['wh']['wh_decision'] > 0, 'wh'])
+    return np.concatenate([trans_vol, [1.0 if x in wh_open else 0.0 for x in lp['wh']]])
+
+
+def highs_model(lp):
+    # highs instance in process with matrix passed column wise, no problem file is written
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    A = lp['A']
+    h.passModel(A.shape[1], A.shape[0], A.nnz, int(highspy.MatrixFormat.kColwise), int(highspy.ObjSense.kMaximize), 0,
+                lp['c'], lp['col_lb'], lp['col_ub'], lp['row_lb'], lp['row_ub'],
+                A.indptr.astype(np.int32), A.indices.astype(np.int32), A.data, lp['integer'].astype(np.int32))
+    return h
+
+
+def highs_update(h, old, lp):
+    # change values of highs instance built from old lp in place, False if lanes or pattern of matrix are different
+    A, B = lp['A'], old['A']
+    if (A.shape != B.shape or not np.array_equal(A.indptr, B.indptr) or not np.array_equal(A.indices, B.indices)
+            or not np.array_equal(lp['integer'], old['integer']) or lp['wh'] != old['wh'] or not lp['lanes'].equals(old['lanes'])):
+        return False
+    idx = np.nonzero(lp['c'] != old['c'])[0].astype(np.int32)
+    if len(idx) > 0:
+        h.changeColsCost(len(idx), idx, lp['c'][idx])
+    idx = np.nonzero((lp['col_lb'] != old['col_lb']) | (lp['col_ub'] != old['col_ub']))[0].astype(np.int32)
+    if len(idx) > 0:
+        h.changeColsBounds(len(idx), idx, lp['col_lb'][idx], lp['col_ub'][idx])
+    idx = np.nonzero((lp['row_lb'] != old['row_lb']) | (lp['row_ub'] != old['row_ub']))[0].astype(np.int32)
+    if len(idx) > 0:
+        h.changeRowsBounds(len(idx), idx, lp['row_lb'][idx], lp['row_ub'][idx])
+    col = np.repeat(np.arange(A.shape[1]), np.diff(A.indptr))
+    for k in np.nonzero(A.data != B.data)[0]:
+        h.changeCoeff(int(A.indices[k]), int(col[k]), float(A.data[k]))
+    return True
+
+
+def highs_size(lp):
+    # approximate memory of lp and its copy in highs instance
+    return 2 * (lp['A'].data.nbytes + lp['A'].indices.nbytes + lp['A'].indptr.nbytes
+                + sum(lp[x].nbytes for x in ['row_lb', 'row_ub', 'c', 'col_lb', 'col_ub']))
+
+
+def solve_highs(h, lp, start=None, timing=None, options=None):
+    # solve highs instance in process, start is previous solution given to highs as initial solution
+    # options of cached instance are reset to options of this solve
+    # return solver status, termination condition, trans_vol of each lane and relative gap
+    timing = {} if timing is None else timing
+    t = time.time()
+    h.resetOptions()
+    h.setOptionValue('output_flag', False)
+    for key, val in (options or {}).items():
+        h.setOptionValue(key, val)
+    if start is not None:
+        solution = highspy.HighsSolution()
+        solution.col_value = list(start_values(lp, start))
+        solution.value_valid = True
+        h.setSolution(solution)
+    h.run()
+    t = mod.timed(timing, 'time_solver_run_sec', t)
+    condition = h.getModelStatus()
+    info = h.getInfo()
+    gap = mip_gap(info.mip_dual_bound, info.objective_function_value)
+    if condition == highspy.HighsModelStatus.kOptimal:
+        solver_status, condition, x = 'ok', 'optimal', np.array(h.getSolution().col_value)
+    elif condition == highspy.HighsModelStatus.kInfeasible:
+        solver_status, condition, x, gap = 'warning', 'infeasible', None, None
+    elif info.primal_solution_status == 2:
+        # stopped by limit with feasible incumbent
+        solver_status, condition, x = 'aborted', h.modelStatusToString(condition).lower(), np.array(h.getSolution().col_value)
+    else:
+        solver_status, condition, x, gap = 'warning', h.modelStatusToString(condition).lower(), None, None
+    df_output = lp['lanes'].copy()
+    df_output['vol'] = x[:len(df_output)] if x is not None else np.nan
+    mod.timed(timing, 'time_result_load_sec', t)
+    return solver_status, condition, df_output, gap
+
+
+def solve(lp, solve_engine='cbc', path=None, start=None, timing=None, options=None):
+    # write mps, run solver executable and read solution, highs is solved in process
+    # start is previous solution used as mip start, options are command line options of solver
+    # return solver status, termination condition, trans_vol of each lane and relative gap
+    timing = {} if timing is None else timing
+    options = {} if options is None else options
+    if solve_engine == 'highs':
+        t = time.time()
+        h = highs_model(lp)
+        mod.timed(timing, 'time_solver_write_sec', t)
+        return solve_highs(h, lp, start, timing, options)
+    path = executable[solve_engine] if path is None else path
+    tmp = tempfile.mkdtemp()
+    try:
+        t = time.time()
+        mps = os.path.join(tmp, 'model.mps')
+        sol = os.path.join(tmp, 'model.sol')
+        log = os.path.join(tmp, 'model.log')
+        write_mps(lp, mps)
+        if solve_engine == 'glpk':
+            t = mod.timed(timing, 'time_solver_write_sec', t)
+            command = [path, '--freemps', mps, '--write', sol]
+            for key, val in options.items():
+                command += ['--%s' % key, str(val)]
+            with open(log, 'w') as f:
+                subprocess.run(command, stdout=f, check=True)
+            t = mod.timed(timing, 'time_solver_run_sec', t)
+            solver_status, condition, x = read_glpk(sol, lp)
+            bound = read_glpk_bound(log)
+        else:
+            command = [path, mps]
+            if start is not None:
+                mst = os.path.join(tmp, 'model.mst')
+                write_mipstart(lp, mst, start)
+                command += ['mips', mst]
+            for key, val in options.items():
+                command += ['-%s' % key, str(val)]
+            t = mod.timed(timing, 'time_solver_write_sec', t)
+            with open(log, 'w') as f:
+                subprocess.run(command + ['solve', 'solution', sol], stdout=f, check=True)
+            t = mod.timed(timing, 'time_solver_run_sec', t)
+            solver_status, condition, x = read_cbc(sol, lp)
+            bound = read_cbc_bound(log)
+    finally:
+        shutil.rmtree(tmp)
+    # incumbent of solve stopped by limit is used only when it is feasible
+    if x is not None and condition != 'optimal' and not feasible(lp, x):
+        solver_status, x = 'warning', None
+    df_output = lp['lanes'].copy()
+    df_output['vol'] = x[:len(df_output)] if x is not None else np.nan
+    # gap is 0 when solver proves optimal without reporting bound
+    gap = None
+    if x is not None:
+        objective = float(lp['c'] @ x)
+        gap = mip_gap(objective if bound is None and condition == 'optimal' else bound, objective)
+    mod.timed(timing, 'time_result_load_sec', t)
+    return solver_status, condition, df_output, gap
@@ -1,13 +1,23 @@
-import io
+import os
+import math
+import time
 import datetime
+import hashlib
+import resource
+import tempfile
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from pytz import timezone
 import numpy as np
 import pandas as pd
 import xlrd
+from scipy import sparse
+from scipy.sparse import csgraph
 import pyomo.environ as pyomo
 from pyomo.opt import SolverFactory
 
+from models import matrix
 import mod
 
 p = mod.PathFile()
@@ -28,8 +38,679 @@ sheet_master = {'supply': 'supply',
               'route': 'route',
               'warehouse': 'wh',
               'destination': 'dest'}
+id_trans = ['supply', 'prod', 'route', 'wh', 'dest']
 col_str = ["supply", "supply_name", "prod", "prod_name",
-           "route", "route_name", "wh", "wh_name", "dest", "dest_name"]
+           "route", "route_name", "wh", "wh_name", "dest", "dest_name",
+           "scenario", "sheet", "column"]
+scenario_col = ['scenario', 'sheet', 'column', 'factor']
+# columns of transportation lanes in rollup, sheets of output and plot take part of them
+trans_col = ['supply', 'supply_name', 'supply_lat', 'supply_long', 'prod', 'prod_name', 'route', 'route_name',
+             'wh', 'wh_name', 'dest', 'dest_name', 'dest_lat', 'dest_long', 'sell_price', 'var_cost', 'trans_cost']
+trans_val = ['trans_vol', 'trans_rev', 'trans_vc', 'trans_netcon']
+output_trans_col = ['supply', 'supply_name', 'prod', 'prod_name', 'route', 'route_name', 'wh', 'wh_name',
+                    'dest', 'dest_name', 'sell_price', 'var_cost', 'trans_cost'] + trans_val
+plot_trans_col = trans_col[:14] + trans_val
+output_supply_col = ['supply', 'supply_name', 'supply_cap', 'supply_min', 'supply_max', 'supply_min_vol', 'supply_max_vol',
+                     'supply_vol', 'supply_netcon', 'supply_sku', 'supply_utilize', 'supply_netconperunit']
+output_dest_col = ['dest', 'dest_name', 'demand_vol', 'dest_vol']
+model_config = p.config.get('model', {})
+# built models of each user kept in process for next solve, least recently used is dropped over cache_mb
+model_cache = OrderedDict()
+model_cache_mb = model_config.get('cache_mb', 1024)
+# approximate memory of one variable, constraint or param value of pyomo model
+model_item_bytes = 400
+# big-M of warehouse decision, total demand (total), bound of each warehouse (warehouse) or also linking row of each warehouse and demand (demand)
+model_big_m = model_config.get('big_m', 'total')
+# independent regions of network solved in process pool of worker size
+model_worker = model_config.get('worker', 2)
+# data of optimize in each worker process of component solve
+component_data = {}
+# solver option profiles chosen in solve tab, options of each profile are mapped to option names of engine
+# engine key of profile holds options passed to that engine as they are
+solver_profile = p.config.get('solver_profile', {})
+solver_option = {'cbc': {'threads': 'threads', 'time_limit': 'sec', 'gap': 'ratioGap', 'node_limit': 'maxNodes'},
+                 'glpk': {'time_limit': 'tmlim', 'gap': 'mipgap'},
+                 'highs': {'threads': 'threads', 'time_limit': 'time_limit', 'gap': 'mip_rel_gap', 'node_limit': 'mip_max_nodes'}}
+# format of full copy of sheets over excel row limit (csv, parquet or None)
+companion = p.config['app'].get('companion', 'csv')
+
+
+def group_index(index, pos):
+    # group index tuples by the values at given positions in one pass
+    group = defaultdict(list)
+    for x in index:
+        group[tuple(x[i] for i in pos)].append(x)
+    return group
+
+
+def read_workbook(file, sheets):
+    # open workbook once and parse the given sheets, columns not in col_str are converted to float
+    xl = pd.ExcelFile(file)
+    df_dict = {}
+    for sheet in [x for x in sheets if x in xl.sheet_names]:
+        df = xl.parse(sheet, dtype=str)
+        for col in [x for x in df.columns if x not in col_str]:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df_dict[sheet] = df
+    return df_dict
+
+
+def prepare_data(df_dict):
+    # manipulate some tables
+    df_dict['supplychain_param'] = df_dict['supplychain_param'].dropna()
+    df_dict['supplychain_param'] = df_dict['supplychain_param'][df_dict['supplychain_param']['sell_price'] > 0]
+    df_dict['supply_param']['supply_min_vol'] = df_dict['supply_param']['supply_cap'] * df_dict['supply_param']['supply_min']
+    df_dict['supply_param']['supply_max_vol'] = df_dict['supply_param']['supply_cap'] * df_dict['supply_param']['supply_max']
+    df_dict['logistics_param']['logis_min_vol'] = df_dict['logistics_param']['logis_cap'] * df_dict['logistics_param']['logis_min']
+    df_dict['logistics_param']['logis_max_vol'] = df_dict['logistics_param']['logis_cap'] * df_dict['logistics_param']['logis_max']
+    # combine all data
+    df_combine = df_dict['supplychain_param'].copy()
+    df_combine = pd.merge(df_combine, df_dict['supply'], on='supply', how='left')
+    df_combine = pd.merge(df_combine, df_dict['product'], on='prod', how='left')
+    df_combine = pd.merge(df_combine, df_dict['route'], on='route', how='left')
+    df_combine = pd.merge(df_combine, df_dict['warehouse'], on='wh', how='left')
+    df_combine = pd.merge(df_combine, df_dict['destination'], on='dest', how='left')
+    df_combine = pd.merge(df_combine, df_dict['supply_param'], on='supply', how='left')
+    df_combine = pd.merge(df_combine, df_dict['supplyproduct_param'], on=['supply', 'prod'], how='left')
+    df_combine = pd.merge(df_combine, df_dict['logistics_param'], on=['supply', 'route', 'wh', 'dest'], how='left')
+    df_combine = pd.merge(df_combine, df_dict['warehouse_param'], on='wh', how='left')
+    df_combine = pd.merge(df_combine, df_dict['demand_param'], on=['prod', 'dest'], how='left')
+    df_dict['combine'] = df_combine.copy()
+    return df_dict
+
+
+def lane_param(lanes, keys, param, cols, default):
+    # param values on distinct keys of lanes, missing values take default
+    df = pd.merge(lanes[keys].drop_duplicates(), param[keys + cols].drop_duplicates(keys), on=keys, how='left')
+    index = list(df[keys].itertuples(index=False, name=None)) if len(keys) > 1 else list(df[keys[0]])
+    return index, [dict(zip(index, df[col].fillna(val))) for col, val in zip(cols, default)]
+
+
+def model_data(df_dict):
+    # sparse index sets and param values of model, only keys that occur in transportation lanes
+    lanes = df_dict['supplychain_param']
+    index, param = {}, {}
+    index['ID_TRANS'] = list(lanes[id_trans].itertuples(index=False, name=None))
+    param['margin'] = dict(zip(index['ID_TRANS'], lanes['sell_price'] - lanes['var_cost'] - lanes['trans_cost']))
+    index['ID_SUPPLY'], (param['supply_min'], param['supply_max']) = lane_param(
+        lanes, ['supply'], df_dict['supply_param'], ['supply_min_vol', 'supply_max_vol'], [0, 0])
+    index['ID_SUPPLYPROD'], (param['supplyprod_cap'],) = lane_param(
+        lanes, ['supply', 'prod'], df_dict['supplyproduct_param'], ['supplyprod_cap'], [10000000])
+    index['ID_LOGIS'], (param['logis_min'], param['logis_max']) = lane_param(
+        lanes, ['supply', 'route', 'wh', 'dest'], df_dict['logistics_param'], ['logis_min_vol', 'logis_max_vol'], [0, 1000000000])
+    index['ID_WH'], (param['wh_fc'], param['wh_min'], param['wh_max']) = lane_param(
+        lanes, ['wh'], df_dict['warehouse_param'], ['wh_fc', 'wh_min_vol', 'wh_max_vol'], [1000000000, 0, 1000000000])
+    index['ID_DEMAND'], (param['demand_vol'],) = lane_param(
+        lanes, ['prod', 'dest'], df_dict['demand_param'], ['demand_vol'], [0])
+    param['max_vol'] = df_dict['demand_param']['demand_vol'].sum()
+    # tightened big-M of warehouse decision, per warehouse and per lane
+    if model_big_m != 'total':
+        param['wh_m'], param['link_max'] = link_bound(df_dict, model_big_m == 'demand')
+        index['ID_LINK'] = list(param['link_max'])
+    return index, param
+
+
+# param of lanes used by presolve and link bounds, default as in model
+presolve_param = [(['supply'], 'supply_param', ['supply_min_vol', 'supply_max_vol'], [0, 0]),
+                  (['supply', 'prod'], 'supplyproduct_param', ['supplyprod_cap'], [10000000]),
+                  (['supply', 'route', 'wh', 'dest'], 'logistics_param', ['logis_min_vol', 'logis_max_vol'], [0, 1000000000]),
+                  (['prod', 'dest'], 'demand_param', ['demand_vol'], [0]),
+                  (['wh'], 'warehouse_param', ['wh_min_vol', 'wh_max_vol'], [0, 1000000000])]
+# constraint groups of lanes with lower and upper bound
+presolve_group = [(['supply'], 'supply_min_vol', 'supply_max_vol'),
+                  (['supply', 'prod'], None, 'supplyprod_cap'),
+                  (['supply', 'route', 'wh', 'dest'], 'logis_min_vol', 'logis_max_vol'),
+                  (['prod', 'dest'], 'demand_vol', 'demand_vol'),
+                  (['wh'], 'wh_min_vol', 'wh_max_vol')]
+
+
+def lane_frame(df_dict):
+    # lanes with bound params of their supply, supply product, logistics, demand and warehouse
+    lanes = df_dict['supplychain_param'][id_trans].reset_index(drop=True)
+    for keys, sheet, cols, default in presolve_param:
+        lanes = pd.merge(lanes, df_dict[sheet][keys + cols].drop_duplicates(keys), on=keys, how='left')
+        for col, val in zip(cols, default):
+            lanes[col] = lanes[col].fillna(val)
+    return lanes
+
+
+def link_bound(df_dict, demand=True):
+    # upper bound of volume of each warehouse, min of warehouse max, reachable demand, logistics max, bounds of its lanes and total demand
+    # bound of lane is min of supply max, supply product cap, logistics max, demand and warehouse max
+    # with demand, also bound of lanes of each warehouse to each demand (wh, prod, dest), min of demand and bounds of its lanes,
+    # only where tighter than bound of warehouse, otherwise its linking row is implied
+    # return bound of warehouses and bound of (wh, prod, dest) with own linking row
+    lanes = lane_frame(df_dict)
+    lanes['lane_max'] = lanes[['supply_max_vol', 'supplyprod_cap', 'logis_max_vol', 'demand_vol', 'wh_max_vol']].min(axis=1).clip(lower=0)
+    wh_m = pd.concat([lanes.drop_duplicates('wh').set_index('wh')['wh_max_vol'],
+                      lanes.drop_duplicates(['wh', 'prod', 'dest']).groupby('wh')['demand_vol'].sum(),
+                      lanes.drop_duplicates(['supply', 'route', 'wh', 'dest']).groupby('wh')['logis_max_vol'].sum(),
+                      lanes.groupby('wh')['lane_max'].sum()], axis=1).min(axis=1)
+    wh_m = wh_m.clip(lower=0, upper=df_dict['demand_param']['demand_vol'].sum())
+    link = {}
+    if demand:
+        group = lanes.groupby(['wh', 'prod', 'dest'], sort=False).agg({'lane_max': 'sum', 'demand_vol': 'first'})
+        group = np.minimum(group['lane_max'], group['demand_vol'].clip(lower=0))
+        link = group[group.values < group.index.get_level_values('wh').map(wh_m).values].to_dict()
+    return wh_m.to_dict(), link
+
+
+def presolve(df_dict):
+    # remove lanes with volume fixed at 0 by zero demand or zero capacity, warehouses without lanes left are removed
+    # lanes of a group are kept if all would be removed and its bounds exclude 0, model stays infeasible
+    # demand is equality so margin does not decide whether lane is shipped
+    # warehouse with min volume has to be opened, its decision is fixed at 1
+    # return reduced data, removed lanes, fixed warehouses and reduction stats
+    lanes = lane_frame(df_dict)
+    zero_demand = (lanes['demand_vol'] == 0).values
+    zero_cap = ((lanes['supply_max_vol'] == 0) | (lanes['supplyprod_cap'] == 0)
+                | (lanes['logis_max_vol'] == 0) | (lanes['wh_max_vol'] == 0)).values
+    remove = pd.Series(zero_demand | zero_cap)
+    keep = np.zeros(len(lanes), dtype=bool)
+    for keys, lb, ub in presolve_group:
+        bound = lanes[ub] < 0 if lb is None else (lanes[lb] > 0) | (lanes[ub] < 0)
+        keep |= (remove.groupby([lanes[k] for k in keys]).transform('all') & bound).values
+    remove = remove.values & ~keep
+
+    df_dict = dict(df_dict)
+    df_dict['supplychain_param'] = df_dict['supplychain_param'][~remove]
+    wh = lanes.loc[~remove, ['wh', 'wh_min_vol']].drop_duplicates('wh')
+    wh_fixed = list(wh.loc[wh['wh_min_vol'] > 0, 'wh'])
+    stats = {'presolve_lanes': len(lanes),
+             'presolve_lanes_removed': int(remove.sum()),
+             'presolve_zero_demand_lanes': int((remove & zero_demand).sum()),
+             'presolve_zero_cap_lanes': int((remove & zero_cap & ~zero_demand).sum()),
+             'presolve_wh_removed': lanes['wh'].nunique() - len(wh),
+             'presolve_wh_fixed': len(wh_fixed)}
+    return df_dict, lanes.loc[remove, id_trans], wh_fixed, stats
+
+
+def build_model(df_dict, timing=None):
+    timing = {} if timing is None else timing
+    t = time.time()
+    index, param = model_data(df_dict)
+    t = mod.timed(timing, 'time_param_sec', t)
+
+    # model
+    model = pyomo.ConcreteModel()
+
+    # define sets
+    model.I = pyomo.Set(initialize=list(df_dict['supply']['supply']), doc='i_supply')
+    model.J = pyomo.Set(initialize=list(df_dict['product']['prod']), doc='i_product')
+    model.K = pyomo.Set(initialize=list(df_dict['route']['route']), doc='i_route')
+    model.L = pyomo.Set(initialize=list(df_dict['warehouse']['wh']), doc='i_warehouse')
+    model.M = pyomo.Set(initialize=list(df_dict['destination']['dest']), doc='i_destination')
+    model.ID_TRANS = pyomo.Set(initialize=index['ID_TRANS'], doc='i_transportation')
+    model.ID_SUPPLY = pyomo.Set(initialize=index['ID_SUPPLY'], doc='i_supply_transportation')
+    model.ID_SUPPLYPROD = pyomo.Set(initialize=index['ID_SUPPLYPROD'], doc='i_supplyprod_transportation')
+    model.ID_LOGIS = pyomo.Set(initialize=index['ID_LOGIS'], doc='i_logistics_transportation')
+    model.ID_WH = pyomo.Set(initialize=index['ID_WH'], doc='i_warehouse_decision')
+    model.ID_DEMAND = pyomo.Set(initialize=index['ID_DEMAND'], doc='i_demand_transportation')
+
+    # set parameters
+    model.supply_min = pyomo.Param(model.ID_SUPPLY, initialize=param['supply_min'], default=0, mutable=True, doc='p_supply_min')
+    model.supply_max = pyomo.Param(model.ID_SUPPLY, initialize=param['supply_max'], default=0, mutable=True, doc='p_supply_max')
+    model.supplyprod_cap = pyomo.Param(model.ID_SUPPLYPROD, initialize=param['supplyprod_cap'], default=10000000, mutable=True, doc='p_supplyprod_cap')
+    model.logis_min = pyomo.Param(model.ID_LOGIS, initialize=param['logis_min'], default=0, mutable=True, doc='p_logistics_min')
+    model.logis_max = pyomo.Param(model.ID_LOGIS, initialize=param['logis_max'], default=1000000000, mutable=True, doc='p_logistics_max')
+    model.margin = pyomo.Param(model.ID_TRANS, initialize=param['margin'], default=0, mutable=True, doc='p_supplychain_margin')
+    model.wh_fc = pyomo.Param(model.ID_WH, initialize=param['wh_fc'], default=1000000000, mutable=True, doc='p_warehoues_fc')
+    model.wh_min = pyomo.Param(model.ID_WH, initialize=param['wh_min'], default=0, mutable=True, doc='p_warehouse_min')
+    model.wh_max = pyomo.Param(model.ID_WH, initialize=param['wh_max'], default=1000000000, mutable=True, doc='p_warehouse_max')
+    model.demand_vol = pyomo.Param(model.ID_DEMAND, initialize=param['demand_vol'], default=0, mutable=True, doc='p_demand_value')
+    model.max_vol = pyomo.Param(initialize=param['max_vol'], mutable=True, doc='p_total_demand')
+    if model_big_m != 'total':
+        model.ID_LINK = pyomo.Set(initialize=index['ID_LINK'], doc='i_warehouse_demand_link')
+        model.wh_m = pyomo.Param(model.ID_WH, initialize=param['wh_m'], default=0, mutable=True, doc='p_warehouse_bigm')
+        model.link_max = pyomo.Param(model.ID_LINK, initialize=param['link_max'], default=0, mutable=True, doc='p_warehouse_demand_bigm')
+
+    # create decision variables
+    model.trans_vol = pyomo.Var(model.ID_TRANS, domain=pyomo.NonNegativeReals, bounds=(0, None), doc='v_transportation_volume')
+    model.wh_decision = pyomo.Var(model.ID_WH, domain=pyomo.Integers, bounds=(0, 1), doc='v_warehouse_decision')
+
+    t = mod.timed(timing, 'time_component_sec', t)
+
+    # group transportation index by key in one pass
+    idr = {k: v for k, v in zip(['i', 'j', 'k', 'l', 'm'], range(5))}
+    group_i = group_index(index['ID_TRANS'], [idr['i']])
+    group_ij = group_index(index['ID_TRANS'], [idr['i'], idr['j']])
+    group_iklm = group_index(index['ID_TRANS'], [idr['i'], idr['k'], idr['l'], idr['m']])
+    group_jm = group_index(index['ID_TRANS'], [idr['j'], idr['m']])
+    group_l = group_index(index['ID_TRANS'], [idr['l']])
+
+    # constraints, nonzeros are counted as they are added
+    model.c = pyomo.ConstraintList(doc='constraints')
+    nnz = 0
+    # supply min/max
+    for (i,), idx in group_i.items():
+        vol = sum([model.trans_vol[x] for x in idx])
+        model.c.add(vol >= model.supply_min[i])
+        model.c.add(vol <= model.supply_max[i])
+        nnz += 2 * len(idx)
+    # supply product cap
+    for (i, j), idx in group_ij.items():
+        vol = sum([model.trans_vol[x] for x in idx])
+        model.c.add(vol <= model.supplyprod_cap[(i, j)])
+        nnz += len(idx)
+    # logistics min/max
+    for (i, k, l, m), idx in group_iklm.items():
+        vol = sum([model.trans_vol[x] for x in idx])
+        model.c.add(vol >= model.logis_min[(i, k, l, m)])
+        model.c.add(vol <= model.logis_max[(i, k, l, m)])
+        nnz += 2 * len(idx)
+    # demand
+    for (j, m), idx in group_jm.items():
+        vol = sum([model.trans_vol[x] for x in idx])
+        model.c.add(vol == model.demand_vol[(j, m)])
+        nnz += len(idx)
+    # warehouse decision, min/max
+    for (l,), idx in group_l.items():
+        vol = sum([model.trans_vol[x] for x in idx])
+        model.c.add(vol <= (model.max_vol if model_big_m == 'total' else model.wh_m[l]) * model.wh_decision[l])
+        model.c.add(vol >= model.wh_min[l])
+        model.c.add(vol <= model.wh_max[l])
+        nnz += 3 * len(idx) + 1
+    # warehouse demand linking, warehouse serves demand only if it is open
+    if model_big_m == 'demand':
+        group_ljm = group_index(index['ID_TRANS'], [idr['l'], idr['j'], idr['m']])
+        for (l, j, m) in index['ID_LINK']:
+            idx = group_ljm[(l, j, m)]
+            vol = sum([model.trans_vol[x] for x in idx])
+            model.c.add(vol <= model.link_max[(l, j, m)] * model.wh_decision[l])
+            nnz += len(idx) + 1
+    model.nnz = nnz
+
+    # objective Function
+    model.objective = pyomo.Objective(
+        expr=sum(model.trans_vol[x] * model.margin[x] for x in index['ID_TRANS'])
+        - sum(model.wh_decision[l] * model.wh_fc[l] for l in index['ID_WH']),
+        sense=pyomo.maximize)
+    mod.timed(timing, 'time_constraint_sec', t)
+    return model
+
+
+def store_params(model, param):
+    for name, val in param.items():
+        getattr(model, name).store_values(val if isinstance(val, dict) else {None: val})
+
+
+def update_model(model, df_dict):
+    # swap mutable params of model built from data with same index sets, False if index sets are different
+    index, param = model_data(df_dict)
+    if any(set(getattr(model, name)) != set(val) for name, val in index.items()):
+        return False
+    store_params(model, param)
+    return True
+
+
+def model_key(df_dict):
+    # structural hash of model, master sets and transportation lanes
+    key = hashlib.sha256()
+    for sheet, col in sheet_master.items():
+        key.update(repr(sorted(df_dict[sheet][col])).encode())
+    key.update(repr(sorted(df_dict['supplychain_param'][id_trans].itertuples(index=False, name=None))).encode())
+    return key.hexdigest()
+
+
+def cached_model(user, df_dict, timing=None):
+    # model of user with same structure gets new param values, otherwise build and cache new model
+    # return model and whether it came from cache
+    timing = {} if timing is None else timing
+    key = model_key(df_dict)
+    if user in model_cache and model_cache[user]['key'] == key:
+        t = time.time()
+        model_cache.move_to_end(user)
+        model = model_cache[user]['model']
+        # warehouse demand linking rows depend on param values, model is built again if they change
+        index, param = model_data(df_dict)
+        if model_big_m != 'demand' or set(model.ID_LINK) == set(index['ID_LINK']):
+            store_params(model, param)
+            mod.timed(timing, 'time_param_sec', t)
+            return model, True
+    model_cache.pop(user, None)
+    model = build_model(df_dict, timing)
+    cache_model(user, {'key': key, 'model': model, 'size': model_size(model)})
+    return model, False
+
+
+def cache_model(name, entry):
+    # add model to cache, least recently used models are dropped over cache_mb
+    model_cache[name] = entry
+    while len(model_cache) > 1 and sum(x['size'] for x in model_cache.values()) > model_cache_mb * 1024 ** 2:
+        model_cache.popitem(last=False)
+    if model_cache[name]['size'] > model_cache_mb * 1024 ** 2:
+        model_cache.pop(name)
+
+
+def cached_highs(user, lp, timing=None):
+    # highs instance of user with same lanes and matrix pattern gets changed values in place, otherwise new instance is cached
+    # return highs instance and whether it came from cache
+    timing = {} if timing is None else timing
+    t = time.time()
+    name = (user, 'highs')
+    if name in model_cache and matrix.highs_update(model_cache[name]['model'], model_cache[name]['lp'], lp):
+        model_cache.move_to_end(name)
+        model_cache[name]['lp'] = lp
+        mod.timed(timing, 'time_solver_write_sec', t)
+        return model_cache[name]['model'], True
+    model_cache.pop(name, None)
+    h = matrix.highs_model(lp)
+    cache_model(name, {'lp': lp, 'model': h, 'size': matrix.highs_size(lp)})
+    mod.timed(timing, 'time_solver_write_sec', t)
+    return h, False
+
+
+def solver_executable(solve_engine):
+    # highs runs in process and has no executable
+    executable = p.config['solver'].get(solve_engine, "None")
+    return None if executable == "None" else executable
+
+
+def time_solver(s, timing):
+    # time problem file write and solver run of pyomo solver, the rest of solve is result load
+    for name, phase in [('_presolve', 'time_solver_write_sec'), ('_apply_solver', 'time_solver_run_sec')]:
+        def call(*args, run=getattr(s, name), phase=phase, **kwargs):
+            t = time.time()
+            result = run(*args, **kwargs)
+            mod.timed(timing, phase, t)
+            return result
+        setattr(s, name, call)
+
+
+def solver_options(solve_engine, profile=None):
+    # options of profile for engine, options the engine does not have are skipped
+    option = solver_profile.get(profile) or {}
+    options = {solver_option[solve_engine][k]: v for k, v in option.items() if k in solver_option.get(solve_engine, {})}
+    options.update(option.get(solve_engine) or {})
+    # glpk time limit is whole seconds, rounded up so that limit under 1 second does not stop glpk at once
+    if solve_engine == 'glpk' and 'tmlim' in options:
+        options['tmlim'] = max(1, int(math.ceil(options['tmlim'])))
+    return options
+
+
+def solve_model(model, solve_engine, executable, warmstart=False, timing=None, options=None):
+    # return solver status, termination condition and relative gap, solution is loaded to model
+    # incumbent of solve stopped by limit is loaded, variables have no value when there is no solution
+    timing = {} if timing is None else timing
+    if executable is None:
+        s = SolverFactory(solve_engine)
+    else:
+        s = SolverFactory(solve_engine, executable=executable)
+    s.options.update(options or {})
+    time_solver(s, timing)
+    t = time.time()
+    # best bound is read from solver log, bound in results of pyomo is not the same in every solver plugin
+    fd, log = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    try:
+        if warmstart and s.warm_start_capable():
+            results = s.solve(model, warmstart=True, load_solutions=False, logfile=log)
+        else:
+            results = s.solve(model, load_solutions=False, logfile=log)
+        bound = matrix.read_bound[solve_engine](log) if solve_engine in matrix.read_bound else None
+    finally:
+        os.remove(log)
+    solver_status, termination_condition = str(results['Solver'][0]['Status']), str(results['Solver'][0]['Termination condition'])
+    gap = None
+    loaded = len(results.solution) > 0 and termination_condition not in ['infeasible', 'unbounded', 'infeasibleOrUnbounded', 'intermediateNonInteger']
+    if loaded:
+        model.solutions.load_from(results)
+    # values of previous solve or initial values are not a solution, incumbent of solve stopped by limit is used only when it is feasible
+    if not loaded or (termination_condition != 'optimal' and not model_feasible(model)):
+        solver_status = 'warning'
+        for x in model.component_data_objects(pyomo.Var):
+            x.value = None
+    else:
+        # gap is 0 when solver proves optimal without reporting bound
+        objective = pyomo.value(model.objective)
+        gap = matrix.mip_gap(objective if bound is None and termination_condition == 'optimal' else bound, objective)
+    mod.timed(timing, 'time_result_load_sec', t)
+    timing['time_result_load_sec'] = round(timing['time_result_load_sec'] - timing.get('time_solver_write_sec', 0) - timing.get('time_solver_run_sec', 0), 3)
+    return solver_status, termination_condition, gap
+
+
+def model_feasible(model, tol=1e-6):
+    # solution loaded to model is within constraint and variable bounds and binaries are integer, relative tolerance for large rows
+    if any(x.value is None for x in model.trans_vol.values()) or any(x.value is None for x in model.wh_decision.values()):
+        return False
+    for c in model.c.values():
+        body = pyomo.value(c.body)
+        scale = tol * max(1, abs(body))
+        if (c.has_lb() and body < pyomo.value(c.lower) - scale) or (c.has_ub() and body > pyomo.value(c.upper) + scale):
+            return False
+    return (all(x.value >= -tol for x in model.trans_vol.values())
+            and all(abs(x.value - round(x.value)) <= tol and -tol <= x.value <= 1 + tol for x in model.wh_decision.values()))
+
+
+def model_size(model):
+    return model_item_bytes * (model.nvariables() + model.nconstraints()
+                                + sum(len(x) for x in model.component_objects(pyomo.Param)))
+
+
+def model_count(model):
+    # size of pyomo model
+    return {'model_variables': model.nvariables(),
+            'model_binaries': sum(1 for x in model.wh_decision.values() if not x.fixed),
+            'model_constraints': model.nconstraints(),
+            'model_nonzeros': model.nnz}
+
+
+def reset_peak_rss():
+    # reset peak resident memory of this process (linux clear_refs), job worker keeps peak of earlier jobs otherwise
+    # return scope of peak reported by peak_rss, this solve (solve) or lifetime of process (process)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return 'solve'
+    except OSError:
+        return 'process'
+
+
+def peak_rss(scope='process'):
+    # peak resident memory of this process in MB since reset_peak_rss, solver runs in a separate process and is not included
+    return {'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), 'peak_rss_scope': scope}
+
+
+def solve_data(df_dict, wh_fixed, backend, solve_engine, executable, start=None, timing=None, user=None, options=None):
+    # build and solve model of lanes in data with pyomo or directly from sparse matrix, pyomo model of user is cached
+    # return solver status, termination condition, volume of lanes, model size, whether model came from cache and relative gap
+    timing = {} if timing is None else timing
+    if backend == 'matrix':
+        t = time.time()
+        link = link_bound(df_dict, model_big_m == 'demand') if model_big_m != 'total' else None
+        lp = matrix.build(df_dict, wh_fixed, link)
+        mod.timed(timing, 'time_param_sec', t)
+        # highs instance of user is kept in process and changed in place for next solve
+        if solve_engine == 'highs' and user is not None:
+            h, reuse = cached_highs(user, lp, timing)
+            solver_status, termination_condition, df_output, gap = matrix.solve_highs(h, lp, start, timing, options)
+            return solver_status, termination_condition, df_output, matrix.count(lp), reuse, gap
+        solver_status, termination_condition, df_output, gap = matrix.solve(lp, solve_engine, executable, start, timing, options)
+        return solver_status, termination_condition, df_output, matrix.count(lp), False, gap
+    if user is None:
+        model, reuse = build_model(df_dict, timing), False
+    else:
+        model, reuse = cached_model(user, df_dict, timing)
+
+    # clear solution of cached model, set previous solution as initial values, lanes and warehouses not in previous solution are 0
+    if reuse:
+        for x in model.component_data_objects(pyomo.Var):
+            x.value = None
+    if start is not None:
+        trans_vol = dict(zip(start['trans'][id_trans].itertuples(index=False, name=None), start['trans']['vol']))
+        for x in model.trans_vol:
+            model.trans_vol[x].value = trans_vol.get(x, 0)
+        wh_decision = dict(zip(start['wh']['wh'], start['wh']['wh_decision']))
+        for l in model.wh_decision:
+            model.wh_decision[l].value = wh_decision.get(l, 0)
+    # warehouse decisions fixed by presolve, cached model may have other fixed warehouses
+    wh_fixed = set(wh_fixed)
+    for l in model.wh_decision:
+        if l in wh_fixed:
+            model.wh_decision[l].fix(1)
+        else:
+            model.wh_decision[l].unfix()
+
+    # solve
+    solver_status, termination_condition, gap = solve_model(model, solve_engine, executable, start is not None, timing, options)
+    t = time.time()
+    df_output = model_output(model)
+    mod.timed(timing, 'time_result_load_sec', t)
+    return solver_status, termination_condition, df_output, model_count(model), reuse, gap
+
+
+def components(lanes):
+    # connected component of each lane in graph of supply, warehouse and demand (prod, dest) linked by lanes
+    if len(lanes) == 0:
+        return np.zeros(0, dtype=int)
+    supply = pd.factorize(lanes['supply'])[0]
+    wh = pd.factorize(lanes['wh'])[0]
+    demand = lanes.groupby(['prod', 'dest'], sort=False).ngroup().values
+    n_supply, n_wh = supply.max() + 1, wh.max() + 1
+    n = n_supply + n_wh + demand.max() + 1
+    graph = sparse.coo_matrix((np.ones(2 * len(lanes)), (np.concatenate([supply, supply]),
+                                                         np.concatenate([n_supply + wh, n_supply + n_wh + demand]))), shape=(n, n))
+    return csgraph.connected_components(graph, directed=False)[1][supply]
+
+
+def component_rows(label):
+    # lanes of each component largest first, small components are packed together up to size of largest component
+    order = np.argsort(label, kind='stable')
+    rows = sorted(np.split(order, np.cumsum(np.bincount(label))[:-1]), key=len, reverse=True)
+    batch = [[rows[0]]]
+    size = len(rows[0])
+    for x in rows[1:]:
+        if size + len(x) > len(rows[0]):
+            batch.append([])
+            size = 0
+        batch[-1].append(x)
+        size += len(x)
+    return [np.sort(np.concatenate(x)) for x in batch]
+
+
+def init_component(df_dict, start, options):
+    component_data['df_dict'] = df_dict
+    component_data['start'] = start
+    component_data['options'] = options
+    reset_peak_rss()
+
+
+def solve_component(rows, wh_fixed, backend, solve_engine, executable):
+    # solve lanes of one component in worker process, return result with its phase timings, gap and peak memory of worker
+    df_dict = dict(component_data['df_dict'])
+    df_dict['supplychain_param'] = df_dict['supplychain_param'].iloc[rows]
+    timing = {}
+    result = solve_data(df_dict, wh_fixed, backend, solve_engine, executable, component_data['start'], timing,
+                        options=component_data['options'])
+    return result[:4] + (timing, result[5], peak_rss()['peak_rss_mb'])
+
+
+def model_output(model):
+    # transportation volume of each lane in solved model
+    data = []
+    for x in model.trans_vol:
+        data.append({
+            "supply": x[0],
+            "prod": x[1],
+            "route": x[2],
+            "wh": x[3],
+            "dest": x[4],
+            "vol": model.trans_vol[x].value
+        })
+    df_output = pd.DataFrame(data)
+    df_output = df_output[['supply', 'prod', 'route', 'wh', 'dest', 'vol']]
+    return df_output
+
+
+def supply_rollup(df_trans, df_route):
+    # product and route volume of each supply sorted by supply then largest volume, map center of each supply
+    df_product = df_trans.groupby(['supply', 'prod', 'prod_name'], as_index=False).agg({'trans_vol': 'sum'})
+    df_product = df_product.sort_values(['supply', 'trans_vol'], ascending=[True, False]).reset_index(drop=True)
+    df_routemap = df_trans.groupby(['supply', 'route_name', 'wh_name', 'dest_name'], as_index=False).agg({'trans_vol': 'sum'})
+    df_routemap = df_routemap.sort_values(['supply', 'trans_vol'], ascending=[True, False]).reset_index(drop=True)
+    df_center = df_route.groupby('supply').agg({'supply_lat': ['sum', 'count'], 'dest_lat': ['sum', 'count'],
+                                               'supply_long': ['sum', 'count'], 'dest_long': ['sum', 'count']})
+    df_center = pd.DataFrame({
+        'center_lat': (df_center['supply_lat']['sum'] + df_center['dest_lat']['sum'])
+        / (df_center['supply_lat']['count'] + df_center['dest_lat']['count']),
+        'center_long': (df_center['supply_long']['sum'] + df_center['dest_long']['sum'])
+        / (df_center['supply_long']['count'] + df_center['dest_long']['count'])}).reset_index()
+    return {'supply_product': df_product, 'supply_route': df_routemap, 'supply_center': df_center}
+
+
+def output_rollup(df_dict):
+    # transportation, route, supply, warehouse, destination and summary of solved lanes
+    # supply, warehouse and destination include all master rows, those without lanes have volume 0
+    lanes = df_dict['output_combine']
+    vol = lanes['vol'].fillna(0)
+    rollup = {}
+
+    # transportation
+    df_trans = lanes[trans_col].assign(trans_vol=lanes['vol'],
+                                       trans_rev=lanes['vol'] * lanes['sell_price'],
+                                       trans_vc=lanes['vol'] * (lanes['var_cost'] + lanes['trans_cost']),
+                                       trans_netcon=lambda x: x['trans_rev'] - x['trans_vc'])
+    rollup['trans'] = df_trans
+
+    # route
+    rollup['route'] = lanes.groupby(['supply', 'supply_name', 'supply_lat', 'supply_long',
+                                     'dest', 'dest_name', 'dest_lat', 'dest_long'], as_index=False).agg({'vol': 'sum'}).rename(columns={'vol': 'route_vol'})
+
+    # supply
+    a = pd.DataFrame({'supply': lanes['supply'], 'prod': lanes['prod'], 'supply_vol': vol,
+                      'supply_netcon': vol * (lanes['sell_price'] - lanes['var_cost'] - lanes['trans_cost'])})
+    a = a.groupby('supply', as_index=False).agg({'supply_vol': 'sum', 'supply_netcon': 'sum', 'prod': 'nunique'}).rename(columns={'prod': 'supply_sku'})
+    df_supply = pd.merge(df_dict['supply'], df_dict['supply_param'], on='supply', how='left')
+    df_supply = pd.merge(df_supply, a, on='supply', how='left').sort_values('supply').reset_index(drop=True)
+    df_supply[['supply_vol', 'supply_netcon', 'supply_sku']] = df_supply[['supply_vol', 'supply_netcon', 'supply_sku']].fillna(0)
+    df_supply['supply_utilize'] = (df_supply['supply_vol'] / df_supply['supply_cap']).fillna(0)
+    df_supply['supply_netconperunit'] = (df_supply['supply_netcon'] / df_supply['supply_vol']).fillna(0)
+    rollup['supply'] = df_supply
+
+    # warehouse
+    a = lanes.groupby('wh', as_index=False).agg({'vol': 'sum'}).rename(columns={'vol': 'wh_vol'})
+    df_wh = pd.merge(df_dict['warehouse'][['wh', 'wh_name']], df_dict['warehouse_param'], on='wh', how='left')
+    df_wh = pd.merge(df_wh, a, on='wh', how='left').sort_values('wh').reset_index(drop=True)
+    df_wh['wh_vol'] = df_wh['wh_vol'].fillna(0)
+    df_wh['wh_fc_val'] = np.where(df_wh['wh_vol'] > 0, df_wh['wh_fc'], 0)
+    rollup['warehouse'] = df_wh
+
+    # destination
+    a = df_dict['demand_param'].groupby('dest', as_index=False).agg({'demand_vol': 'sum'})
+    b = lanes.groupby('dest', as_index=False).agg({'vol': 'sum'}).rename(columns={'vol': 'dest_vol'})
+    df_dest = pd.merge(df_dict['destination'], a, on='dest', how='left')
+    df_dest = pd.merge(df_dest, b, on='dest', how='left').sort_values('dest').reset_index(drop=True)
+    df_dest[['demand_vol', 'dest_vol']] = df_dest[['demand_vol', 'dest_vol']].fillna(0)
+    rollup['destination'] = df_dest
+
+    # drill-down of each supply
+    rollup.update(supply_rollup(df_trans, rollup['route']))
+
+    # total net contribution
+    total_rev = np.sum(df_trans['trans_rev'])
+    total_fc = np.sum(df_wh['wh_fc_val'])
+    total_vc = np.sum(df_trans['trans_vc'])
+    rollup['summary'] = {'Net Contribution': total_rev - (total_fc + total_vc),
+                         'Revenue': total_rev,
+                         'Variable Cost': total_vc,
+                         'Fixed Cost': total_fc}
+    return rollup
+
+
+def save_companion(df, sheet, filename, columns=None):
+    # sheet over excel row limit is cut in workbook, full sheet saved next to workbook as <workbook>_<sheet>.<csv|parquet>
+    if len(df) < mod.excel_max_row or companion == 'None':
+        return {}
+    name = '%s_%s.%s' % (os.path.splitext(filename)[0], sheet, companion)
+    p.savefile(mod.write_table(df if columns is None else df[columns], companion, p.tempfile()), name)
+    return {'%s_companion' % sheet: name}
+
+
+def solution_frames(df_output):
+    # transportation volume and warehouse decision (open if there is volume) of solution
+    df_wh = df_output.groupby('wh', as_index=False).agg({'vol': 'sum'})
+    df_wh['wh_decision'] = (df_wh['vol'] > 0).astype(int)
+    return {'trans': df_output[id_trans + ['vol']], 'wh': df_wh[['wh', 'wh_decision']]}
 
 
 class Optimize:
@@ -39,15 +720,36 @@ class Optimize:
         p.setuser(self.user)
         self.stream = False if p.config['app']['run'] == 'local' else True
 
-    def validate_sheet(self, decoded, upload_status):
-        input_file = io.BytesIO()
-        writer = pd.ExcelWriter(input_file, engine='xlsxwriter')
-        mod.write_dict_to_worksheet(upload_status, 'status', writer.book)
+    def upload_status(self):
+        # status of uploaded input, loaded once from json next to input file or status sheet of input file
+        if getattr(self, 'status', None) is None:
+            try:
+                self.status = mod.read_json(p.loadfile(p.config['file']['status']))
+            except Exception:
+                self.status = mod.read_dict_from_worksheet(p.loadfile(p.config['file']['input']), 'status', self.stream)
+        return dict(self.status)
+
+    def validate_sheet(self, content, upload_status):
+        # content is base64 string of upload file, decoded to temp file
+        upload_file = p.tempfile()
+        upload_status['upload_hash'] = mod.decode_to_file(content, upload_file)
+        input_file = p.tempfile()
+        workbook = mod.workbook(input_file)
+        mod.write_dict_to_worksheet(upload_status, 'status', workbook)
+        # upload status also saved next to input file for later steps
+        p.savefile(mod.write_json(upload_status), p.config['file']['status'])
+        self.status = dict(upload_status)
+        timing = {}
+        t = time.time()
+        sheets = read_workbook(upload_file, list(sheet_dict) + ['scenario'])
+        upload_file.close()
+        mod.timed(timing, 'time_parse_sec', t)
+        valid_sheets = {}
         # get all master data
         master_list = {}
         for sheet in sheet_master:
             try:
-                df = pd.read_excel(io.BytesIO(decoded), sheet_name=sheet, dtype=str).dropna(subset=[sheet_dict[sheet][0]])
+                df = sheets[sheet].dropna(subset=[sheet_dict[sheet][0]])
                 master_list[sheet_master[sheet]] = list(df[sheet_master[sheet]].unique())
             except Exception:
                 master_list[sheet_master[sheet]] = None
@@ -56,10 +758,7 @@ class Optimize:
         status = {}
         for sheet in list(sheet_dict.keys()):
             try:
-                # import all columns as string and convert to float in specific column
-                df = pd.read_excel(io.BytesIO(decoded), sheet_name=sheet, dtype=str).dropna(subset=[sheet_dict[sheet][0]])
-                for col in [x for x in df.columns if x not in col_str]:
-                    df[col] = df[col].apply(lambda x: mod.converttofloat(x))
+                df = sheets[sheet].dropna(subset=[sheet_dict[sheet][0]])
                 df = df[[x for x in sheet_dict[sheet] if x in list(df.columns)]].reset_index(drop=True)
                 # check if columns have duplicate value prior to primary key
                 df_duplicate = df.groupby([x for x in col_master if x in df.columns], as_index=False).size().reset_index(name='cnt')
@@ -74,46 +773,66 @@ class Optimize:
                 status[sheet]['master'] = 0 if sum([x for x in master_error.values()]) <= 0 else 1
                 status[sheet]['duplicate'] = 0 if len(df_duplicate) <= 0 else 1
                 status[sheet]['error'] = 0 if status[sheet]['column'] + status[sheet]['master'] + status[sheet]['duplicate'] <= 0 else 1
-                df.to_excel(writer, sheet_name=sheet, index=False)
+                mod.write_df_to_worksheet(df, sheet, workbook)
+                valid_sheets[sheet] = df
             except Exception:
                 status[sheet] = {}
                 status[sheet]['column'] = None
                 status[sheet]['duplicate'] = None
                 status[sheet]['error'] = 1
-        writer.save()
+        # optional scenario sheet, each row scales a param column of a sheet by factor
+        if 'scenario' in sheets:
+            try:
+                df = sheets['scenario'].dropna(subset=['scenario'])[scenario_col].reset_index(drop=True)
+                param_error = [x not in sheet_dict or y not in sheet_dict[x] or y in col_str or np.isnan(z)
+                               for x, y, z in zip(df['sheet'], df['column'], df['factor'])]
+                status['scenario'] = {}
+                status['scenario']['column'] = 0
+                status['scenario']['master'] = 0 if sum(param_error) <= 0 else 1
+                status['scenario']['duplicate'] = 0 if sum(df.duplicated(['scenario', 'sheet', 'column'])) <= 0 else 1
+                status['scenario']['error'] = 0 if status['scenario']['master'] + status['scenario']['duplicate'] <= 0 else 1
+                mod.write_df_to_worksheet(df, 'scenario', workbook)
+                valid_sheets['scenario'] = df
+            except Exception:
+                status['scenario'] = {}
+                status['scenario']['column'] = 1
+                status['scenario']['master'] = None
+                status['scenario']['duplicate'] = None
+                status['scenario']['error'] = 1
+        workbook.close()
         input_file.seek(0)
         p.savefile(input_file, p.config['file']['input'])
+        # save typed snapshot of validated input for import_data, empty if sheets have error
+        t = time.time()
+        df_dict = prepare_data(valid_sheets) if sum([x['error'] for x in status.values()]) <= 0 else {}
+        mod.timed(timing, 'time_merge_sec', t)
+        timing['upload_hash'] = upload_status['upload_hash']
+        p.savefile(mod.write_frames(df_dict, timing, p.tempfile()), p.config['file']['cache'])
         return status
 
     def import_data(self):
-        # read data and change data types
-        df_dict = {}
-        for sheet in sheet_dict.keys():
-            df = pd.read_excel(p.loadfile(
-                p.config['file']['input']), dtype=str, sheet_name=sheet, index=False)
-            for col in [x for x in df.columns if x not in col_str]:
-                df[col] = df[col].apply(lambda x: mod.converttofloat(x))
-            df_dict[sheet] = df.dropna(subset=[df.columns[0]])
-        # manipulate some tables
-        df_dict['supplychain_param'] = df_dict['supplychain_param'].dropna()
-        df_dict['supplychain_param'] = df_dict['supplychain_param'][df_dict['supplychain_param']['sell_price'] > 0]
-        df_dict['supply_param']['supply_min_vol'] = df_dict['supply_param']['supply_cap'] * df_dict['supply_param']['supply_min']
-        df_dict['supply_param']['supply_max_vol'] = df_dict['supply_param']['supply_cap'] * df_dict['supply_param']['supply_max']
-        df_dict['logistics_param']['logis_min_vol'] = df_dict['logistics_param']['logis_cap'] * df_dict['logistics_param']['logis_min']
-        df_dict['logistics_param']['logis_max_vol'] = df_dict['logistics_param']['logis_cap'] * df_dict['logistics_param']['logis_max']
-        # combine all data
-        df_combine = df_dict['supplychain_param'].copy()
-        df_combine = pd.merge(df_combine, df_dict['supply'], on='supply', how='left')
-        df_combine = pd.merge(df_combine, df_dict['product'], on='prod', how='left')
-        df_combine = pd.merge(df_combine, df_dict['route'], on='route', how='left')
-        df_combine = pd.merge(df_combine, df_dict['warehouse'], on='wh', how='left')
-        df_combine = pd.merge(df_combine, df_dict['destination'], on='dest', how='left')
-        df_combine = pd.merge(df_combine, df_dict['supply_param'], on='supply', how='left')
-        df_combine = pd.merge(df_combine, df_dict['supplyproduct_param'], on=['supply', 'prod'], how='left')
-        df_combine = pd.merge(df_combine, df_dict['logistics_param'], on=['supply', 'route', 'wh', 'dest'], how='left')
-        df_combine = pd.merge(df_combine, df_dict['warehouse_param'], on='wh', how='left')
-        df_combine = pd.merge(df_combine, df_dict['demand_param'], on=['prod', 'dest'], how='left')
-        df_dict['combine'] = df_combine.copy()
+        # read typed snapshot of validated input, fall back to parse input file
+        # snapshot of other upload (hash of upload in manifest is not hash in upload status) is not used
+        # parse and merge time of upload is kept in snapshot manifest
+        self.timing = {}
+        t = time.time()
+        try:
+            manifest, df_dict = mod.read_frames(p.loadfile(p.config['file']['cache']))
+            if manifest.get('upload_hash') != self.upload_status().get('upload_hash'):
+                df_dict = {}
+            self.timing.update({k: v for k, v in manifest.items() if k.startswith('time_')})
+        except Exception:
+            df_dict = {}
+        if 'combine' not in df_dict:
+            self.timing = {}
+            df_dict = read_workbook(p.loadfile(p.config['file']['input']), list(sheet_dict) + ['scenario'])
+            for sheet, df in df_dict.items():
+                df_dict[sheet] = df.dropna(subset=[df.columns[0]])
+            t = mod.timed(self.timing, 'time_parse_sec', t)
+            df_dict = prepare_data(df_dict)
+            mod.timed(self.timing, 'time_merge_sec', t)
+        else:
+            mod.timed(self.timing, 'time_load_sec', t)
         # save to self
         self.df_dict = df_dict
 
@@ -122,13 +841,13 @@ class Optimize:
         status = {}
         df_demand = self.df_dict['demand_param'].copy()
         df_combine = self.df_dict['combine'].copy()
-        error_file = io.BytesIO()
-        writer = pd.ExcelWriter(error_file, engine='xlsxwriter')
+        error_file = p.tempfile()
+        workbook = mod.workbook(error_file)
 
         # write sheet status to workbook
-        sheet_status = mod.read_dict_from_worksheet(p.loadfile(p.config['file']['input']), 'status', self.stream)
+        sheet_status = self.upload_status()
         sheet_status['validate_datetime'] = datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
-        mod.write_dict_to_worksheet(sheet_status, 'status', writer.book)
+        mod.write_dict_to_worksheet(sheet_status, 'status', workbook)
 
         # validate 1- check if all demand have supply chain param
         a = df_demand.copy()
@@ -137,7 +856,7 @@ class Optimize:
         df_valid1 = df_valid1.groupby(['prod', 'dest', 'demand_vol'], as_index=False).agg({"supply": "count"}).rename(columns={'supply': 'supplychain_param'})
         df_valid1['validate'] = df_valid1['supplychain_param'] > 0
         status['validate1'] = 1 if False in df_valid1['validate'].tolist() else 0
-        df_valid1.to_excel(writer, sheet_name="validate1", index=False)
+        mod.write_df_to_worksheet(df_valid1, 'validate1', workbook)
 
         # validate 2 - demand volume vs supplyprod cap (by product)
         a = df_combine[['prod', 'dest', 'demand_vol']].drop_duplicates().groupby(['prod']).sum().reset_index()
@@ -145,7 +864,7 @@ class Optimize:
         df_valid2 = pd.merge(a, b, on='prod', how='left')
         df_valid2['validate'] = df_valid2['supplyprod_cap'] >= df_valid2['demand_vol']
         status['validate2'] = 1 if False in df_valid2['validate'].tolist() else 0
-        df_valid2.to_excel(writer, sheet_name="validate2", index=False)
+        mod.write_df_to_worksheet(df_valid2, 'validate2', workbook)
 
         # validate 3 - demand volume vs logistics cap (by destination)
         a = df_combine[['prod', 'dest', 'demand_vol']].drop_duplicates().groupby(['dest']).sum().reset_index()
@@ -153,7 +872,7 @@ class Optimize:
         df_valid3 = pd.merge(a, b, on='dest', how='left')
         df_valid3['validate'] = df_valid3['logis_max_vol'] >= df_valid3['demand_vol']
         status['validate3'] = 1 if False in df_valid3['validate'].tolist() else 0
-        df_valid3.to_excel(writer, sheet_name="validate3", index=False)
+        mod.write_df_to_worksheet(df_valid3, 'validate3', workbook)
 
         # validate 4 - logistics cap vs supply cap (by supply)
         a = df_combine[['supply', 'supply_min_vol', 'supply_max_vol']].drop_duplicates()
@@ -162,282 +881,198 @@ class Optimize:
         df_valid4['validate1'] = df_valid4['supply_min_vol'] <= df_valid4['logis_max_vol']
         df_valid4['validate2'] = df_valid4['supply_max_vol'] >= df_valid4['logis_min_vol']
         status['validate4'] = 1 if False in df_valid4['validate1'].tolist() and False in df_valid4['validate2'].tolist() else 0
-        df_valid4.to_excel(writer, sheet_name="validate4", index=False)
+        mod.write_df_to_worksheet(df_valid4, 'validate4', workbook)
 
         # save file
-        writer.save()
+        workbook.close()
         error_file.seek(0)
         p.savefile(error_file, p.config['file']['error'])
 
         return status
 
-    def optimize(self, solve_engine='cbc'):
+    def optimize(self, solve_engine='cbc', backend=None, warm_start=None, profile=None):
         # create status
         status = {}
         start_time = datetime.datetime.now(timezone('Asia/Bangkok'))
         status['optimize_start_time'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
+        rss_scope = reset_peak_rss()
+
+        # previous solution as mip start, only cbc and highs accept mip start
+        warm_start = model_config.get('warm_start', True) if warm_start is None else warm_start
+        saved = self.load_solution()
+        prev = saved if warm_start and solve_engine in ['cbc', 'highs'] else None
+        start = prev[1] if prev is not None else None
 
-        # set index for df
-        df_supply = self.df_dict['supply'].set_index(['supply'])
-        df_prod = self.df_dict['product'].set_index(['prod'])
-        df_route = self.df_dict['route'].set_index(['route'])
-        df_wh = self.df_dict['warehouse'].set_index(['wh'])
-        df_dest = self.df_dict['destination'].set_index(['dest'])
-        df_supply_param = self.df_dict['supply_param'].set_index(['supply'])
-        df_supplyprod_param = self.df_dict['supplyproduct_param'].set_index(['supply', 'prod'])
-        df_logis_param = self.df_dict['logistics_param'].set_index(['supply', 'route', 'wh', 'dest'])
-        df_supplychain_param = self.df_dict['supplychain_param'].set_index(['supply', 'prod', 'route', 'wh', 'dest'])
-        df_wh_param = self.df_dict['warehouse_param'].set_index(['wh'])
-        df_demand_param = self.df_dict['demand_param'].set_index(['prod', 'dest'])
-
-        # create dict
-        supply_min_vol = dict(zip(df_supply_param.index, df_supply_param.supply_min_vol))
-        supply_max_vol = dict(zip(df_supply_param.index, df_supply_param.supply_max_vol))
-        supplyprod_cap = dict(zip(df_supplyprod_param.index, df_supplyprod_param.supplyprod_cap))
-        wh_min_vol = dict(zip(df_wh_param.index, df_wh_param.wh_min_vol))
-        wh_max_vol = dict(zip(df_wh_param.index, df_wh_param.wh_max_vol))
-        logis_min_vol = dict(zip(df_logis_param.index, df_logis_param.logis_min_vol))
-        logis_max_vol = dict(zip(df_logis_param.index, df_logis_param.logis_max_vol))
-        sell_price = dict(zip(df_supplychain_param.index, df_supplychain_param.sell_price))
-        var_cost = dict(zip(df_supplychain_param.index, df_supplychain_param.var_cost))
-        trans_cost = dict(zip(df_supplychain_param.index, df_supplychain_param.trans_cost))
-        wh_fc = dict(zip(df_wh_param.index, df_wh_param.wh_fc))
-        demand_vol = dict(zip(df_demand_param.index, df_demand_param.demand_vol))
-
-        # model
-        model = pyomo.ConcreteModel()
-
-        # define sets
-        model.I = pyomo.Set(initialize=list(df_supply.index), doc='i_supply')
-        model.J = pyomo.Set(initialize=list(df_prod.index), doc='i_product')
-        model.K = pyomo.Set(initialize=list(df_route.index), doc='i_route')
-        model.L = pyomo.Set(initialize=list(df_wh.index), doc='i_warehouse')
-        model.M = pyomo.Set(initialize=list(df_dest.index), doc='i_destination')
-        model.ID_TRANS = pyomo.Set(initialize=list(df_supplychain_param.index), doc='i_transportation')
-        model.ID_WH = pyomo.Set(initialize=set(x[3] for x in df_supplychain_param.index), doc='i_warehouse_decision')
-
-        # set parameters
-        model.supply_min = pyomo.Param(model.I, initialize=supply_min_vol, default=0, mutable=True, doc='p_supply_min')
-        model.supply_max = pyomo.Param(model.I, initialize=supply_max_vol, default=0, mutable=True, doc='p_supply_max')
-        model.supplyprod_cap = pyomo.Param(model.I, model.J, initialize=supplyprod_cap, default=10000000, mutable=True, doc='p_supplyprod_cap')
-        model.logis_min = pyomo.Param(model.I, model.K, model.L, model.M, initialize=logis_min_vol, default=0, mutable=True, doc='p_logistics_min')
-        model.logis_max = pyomo.Param(model.I, model.K, model.L, model.M, initialize=logis_max_vol, default=1000000000, mutable=True, doc='p_logistics_max')
-        model.sell_price = pyomo.Param(model.I, model.J, model.K, model.L, model.M, initialize=sell_price, default=0, mutable=True, doc='p_supplychain_selling_price')
-        model.var_cost = pyomo.Param(model.I, model.J, model.K, model.L, model.M, initialize=var_cost, default=1000000000, mutable=True, doc='p_supplychain_vc')
-        model.trans_cost = pyomo.Param(model.I, model.J, model.K, model.L, model.M, initialize=trans_cost, default=1000000000, mutable=True, doc='p_supplychain_transportation_cost')
-        model.wh_fc = pyomo.Param(model.L, initialize=wh_fc, default=1000000000, mutable=True, doc='p_warehoues_fc')
-        model.wh_min = pyomo.Param(model.L, initialize=wh_min_vol, default=0, mutable=True, doc='p_warehouse_min')
-        model.wh_max = pyomo.Param(model.L, initialize=wh_max_vol, default=1000000000, mutable=True, doc='p_warehouse_max')
-        model.demand_vol = pyomo.Param(model.J, model.M, initialize=demand_vol, default=0, mutable=True, doc='p_demand_value')
-
-        # create decision variables
-        model.trans_vol = pyomo.Var(model.ID_TRANS, domain=pyomo.NonNegativeReals, bounds=(0, None), doc='v_transportation_volume')
-        model.wh_decision = pyomo.Var(model.ID_WH, domain=pyomo.Integers, bounds=(0, 1), doc='v_warehouse_decision')
-
-        # constraints
-        model.c = pyomo.ConstraintList(doc='constraints')
-        idr = {k: v for k, v in zip(['i', 'j', 'k', 'l', 'm'], range(5))}
-        # supply min/max
-        for i in set(x[idr['i']] for x in model.ID_TRANS):
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['i']] == i]) 
-                        >= model.supply_min[i])
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['i']] == i]) 
-                        <= model.supply_max[i])
-        # supply product cap
-        for i, j in set((x[idr['i']], x[idr['j']]) for x in model.ID_TRANS):
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['i']] == i and x[idr['j']] == j]) 
-                        <= model.supplyprod_cap[(i, j)])
-        # logistics min/max
-        for i, k, l, m in set((x[idr['i']], x[idr['k']], x[idr['l']], x[idr['m']]) for x in model.ID_TRANS):
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['i']] == i and x[idr['k']] == k and x[idr['l']] == l and x[idr['m']] == m]) 
-                        >= model.logis_min[(i, k, l, m)])
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['i']] == i and x[idr['k']] == k and x[idr['l']] == l and x[idr['m']] == m]) 
-                        <= model.logis_max[(i, k, l, m)])
-        # demand
-        for j, m in set((x[idr['j']], x[idr['m']]) for x in model.ID_TRANS):
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['j']] == j and x[idr['m']] == m]) 
-                         == model.demand_vol[(j, m)])
-        # warehouse decision, min/max
-        max_vol = sum([model.demand_vol[x].value for x in model.demand_vol])
-        for l in set(x[idr['l']] for x in model.ID_TRANS):
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['l']] == l]) 
-                         <= max_vol * model.wh_decision[l])
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['l']] == l]) 
-                         >= model.wh_min[l])
-            model.c.add(sum([model.trans_vol[x] for x in model.trans_vol if x[idr['l']] == l]) 
-                         <= model.wh_max[l])
-
-        # objective Function
-        model.objective = pyomo.Objective(
-            expr=sum((model.trans_vol[(i, j, k, l, m)]*(model.sell_price[(i, j, k, l, m)]-model.var_cost[(i, j, k, l, m)]-model.trans_cost[(i, j, k, l, m)]))
-                     for i, j, k, l, m in list(model.trans_vol)) - sum((model.wh_decision[l]*model.wh_fc[l]) for l in set(x[idr['l']] for x in model.trans_vol)),
-            sense=pyomo.maximize)
-
-        # solve
-        if p.config['solver'][solve_engine] == "None":
-            s = SolverFactory(solve_engine)
+        # build and solve model with pyomo or directly from sparse matrix, highs is solved in process from matrix only
+        backend = model_config.get('backend', 'pyomo') if backend is None else backend
+        backend = 'matrix' if solve_engine == 'highs' else backend
+        executable = solver_executable(solve_engine)
+        # limits of profile apply to each model, solve stopped by limit exports its incumbent
+        options = solver_options(solve_engine, profile)
+        timing = {k: v for k, v in getattr(self, 'timing', {}).items() if k in ['time_parse_sec', 'time_merge_sec', 'time_load_sec']}
+        # presolve removes lanes fixed at 0 and fixes forced warehouse decisions
+        t = time.time()
+        if model_config.get('presolve', True):
+            df_dict, removed, wh_fixed, presolve_stats = presolve(self.df_dict)
         else:
-            s = SolverFactory(solve_engine, executable=p.config['solver'][solve_engine])
-        results = s.solve(model)
+            df_dict, removed, wh_fixed, presolve_stats = self.df_dict, None, [], {}
+        mod.timed(timing, 'time_presolve_sec', t)
+        # independent regions of network are solved as separate models in process pool
+        lanes = df_dict['supplychain_param']
+        label = components(lanes) if model_config.get('decompose', True) else np.zeros(len(lanes), dtype=int)
+        n_component = label.max() + 1 if len(label) > 0 else 0
+        if n_component > 1:
+            rows = component_rows(label)
+            data = {k: v for k, v in df_dict.items() if k != 'combine'}
+            with ProcessPoolExecutor(max_workers=model_worker, initializer=init_component, initargs=(data, start, options)) as executor:
+                result = list(executor.map(solve_component, rows, [wh_fixed] * len(rows), [backend] * len(rows),
+                                           [solve_engine] * len(rows), [executable] * len(rows)))
+            # not optimal if any component is not optimal, size and phase timings are sum of components, gap is largest gap
+            fail = [x for x in result if x[1] != 'optimal']
+            solver_status, termination_condition = fail[0][:2] if fail else result[0][:2]
+            gap = None if any(x[5] is None for x in result) else max(x[5] for x in result)
+            df_output = pd.concat([x[2] for x in result], ignore_index=True, sort=False)
+            count = {k: sum(x[3][k] for x in result) for k in result[0][3]}
+            for x in result:
+                for k, v in x[4].items():
+                    timing[k] = round(timing.get(k, 0) + v, 3)
+            # models of components are built and solved in worker processes, peak is largest of workers
+            component_rss = max(x[6] for x in result)
+            self.model_reuse = False
+            n_model = len(rows)
+        else:
+            solver_status, termination_condition, df_output, count, self.model_reuse, gap = solve_data(
+                df_dict, wh_fixed, backend, solve_engine, executable, start, timing, self.user, options)
+            component_rss = 0
+            n_model = 1
+        # removed lanes have no volume in solution
+        if removed is not None and len(removed) > 0:
+            df_output = pd.concat([df_output, removed.assign(vol=0 if df_output['vol'].notna().all() else np.nan)],
+                                  ignore_index=True, sort=False)
 
         # result
         status['optimize_solver_engine'] = solve_engine
-        status['optimize_solver_status'] = str(results['Solver'][0]['Status'])
-        status['optimize_termination_condition'] = str(results['Solver'][0]['Termination condition'])
+        status['optimize_backend'] = backend
+        status['optimize_model_cache'] = 'hit' if self.model_reuse else 'miss'
+        status['optimize_solver_status'] = solver_status
+        status['optimize_termination_condition'] = termination_condition
+        status['optimize_profile'] = profile if profile in solver_profile else 'default'
+        status['optimize_gap'] = gap
         end_time = datetime.datetime.now(timezone('Asia/Bangkok'))
         status['optimize_end_time'] = end_time.strftime("%Y-%m-%d %H:%M:%S")
         status['optimize_solvetime_sec'] = (end_time - start_time).total_seconds()
+        # compare solver run time of warm run with run without warm start of same upload, engine and backend, None for cold run or when there is no such run
+        # solver run time of cold run of each key of current upload is kept in manifest of solution
+        status['optimize_warmstart'] = 'no' if prev is None else 'yes'
+        upload_hash = self.upload_status().get('upload_hash')
+        coldstart_key = '%s-%s-%s' % (upload_hash, solve_engine, backend)
+        coldstart = {k: v for k, v in (saved[0].get('optimize_coldstart', {}) if saved is not None else {}).items()
+                     if k.startswith('%s-' % upload_hash)}
+        if prev is None and 'time_solver_run_sec' in timing:
+            coldstart[coldstart_key] = timing['time_solver_run_sec']
+        status['optimize_coldstart_sec'] = coldstart.get(coldstart_key)
+        status['optimize_warmstart_saving_sec'] = (None if prev is None or status['optimize_coldstart_sec'] is None or 'time_solver_run_sec' not in timing
+                                                   else round(status['optimize_coldstart_sec'] - timing['time_solver_run_sec'], 3))
+        # phase timings, model size and memory
+        status.update(timing)
+        status.update(count)
+        status.update(presolve_stats)
+        status['optimize_components'] = int(n_component)
+        status['optimize_component_models'] = n_model
+        status['optimize_component_max_lanes'] = int(np.bincount(label).max()) if len(label) > 0 else 0
+        status.update(peak_rss(rss_scope))
+        status['peak_rss_mb'] = max(status['peak_rss_mb'], component_rss)
+
+        # save solution for warm start of next run
+        if df_output['vol'].notna().all():
+            p.savefile(mod.write_frames(solution_frames(df_output), {'optimize_coldstart': coldstart}, p.tempfile()),
+                       p.config['file']['solution'])
 
         # export output
-        data = []
-        for x in model.trans_vol:
-            data.append({
-                "supply": x[0],
-                "prod": x[1],
-                "route": x[2],
-                "wh": x[3],
-                "dest": x[4],
-                "vol": model.trans_vol[x].value
-            })
-        df_output = pd.DataFrame(data)
-        df_output = df_output[['supply', 'prod', 'route', 'wh', 'dest', 'vol']]
-        df_combine = self.df_dict['combine'].copy()
-        df_output_combine = pd.merge(df_combine, df_output, on=['supply', 'prod', 'route', 'wh', 'dest'], how='left')
-        self.df_dict['output'] = df_output.copy()
-        self.df_dict['output_combine'] = df_output_combine.copy()
+        self.df_dict['output'] = df_output
+        self.df_dict['output_combine'] = pd.merge(self.df_dict['combine'], df_output, on=id_trans, how='left')
+        self.df_rollup = None
         return status
 
+    def load_solution(self):
+        # manifest and frames of previous solution, None if there is no solution
+        try:
+            return mod.read_frames(p.loadfile(p.config['file']['solution']))
+        except Exception:
+            return None
+
+    def rollup(self, opt_status):
+        # rollups of solved lanes computed once, shared by output and plot
+        if getattr(self, 'df_rollup', None) is None:
+            t = time.time()
+            self.df_rollup = output_rollup(self.df_dict)
+            mod.timed(opt_status, 'time_rollup_sec', t)
+        return self.df_rollup
+
     def gen_plot(self, opt_status):
-        plot_file = io.BytesIO()
-        writer = pd.ExcelWriter(plot_file, engine='xlsxwriter')
+        rollup = self.rollup(opt_status)
+        t = time.time()
+        plot_file = p.tempfile()
+        workbook = mod.workbook(plot_file)
 
-        # write sheet status to workbook
-        sheet_status = mod.read_dict_from_worksheet(p.loadfile(p.config['file']['input']), 'status', self.stream)
+        # sheet status, written last with time of plot generation
+        sheet_status = self.upload_status()
         sheet_status.update(opt_status)
         sheet_status['plot_datetime'] = datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
-        mod.write_dict_to_worksheet(sheet_status, 'status', writer.book)
 
-        df_combine = self.df_dict['output_combine'].copy()
-        # route
-        df_route = df_combine.copy()
-        df_route = df_route.groupby(['supply', 'supply_name', 'supply_lat', 'supply_long',
-                                     'dest', 'dest_name', 'dest_lat', 'dest_long'], as_index=False).agg({'vol': 'sum'}).rename(columns={'vol': 'route_vol'})
-        df_route.to_excel(writer, sheet_name='route', index=False)
-
-        # supply
-        df_supply = df_combine.copy()
-        df_supply['supply_vol'] = df_supply['vol'].fillna(0)
-        df_supply['supply_netcon'] = df_supply.apply(lambda x: x['supply_vol']*(x['sell_price']+x['var_cost']-x['trans_cost']), axis=1)
-        df_supply = df_supply.groupby(['supply', 'supply_name', 'supply_lat', 'supply_long',
-                                       'supply_cap', 'supply_min', 'supply_max',
-                                       'supply_min_vol', 'supply_max_vol'], as_index=False).agg({'supply_vol': 'sum', 'supply_netcon': 'sum', 'prod': 'count'}).rename(columns={'prod': 'supply_sku'})
-        df_supply['supply_utilize'] = df_supply['supply_vol'] / df_supply['supply_cap']
-        df_supply['supply_netconperunit'] = df_supply['supply_netcon'] / df_supply['supply_vol']
-        df_supply.to_excel(writer, sheet_name='supply', index=False)
-
-        # warehouse
-        df_wh = df_combine.copy()
-        df_wh = df_wh.groupby(['wh', 'wh_name', 'wh_fc', 'wh_min_vol', 'wh_max_vol'], as_index=False).agg({'vol': 'sum'}).rename(columns={'vol': 'wh_vol'})
-        df_wh['wh_fc_val'] = df_wh.apply(lambda x: x['wh_fc'] if x['wh_vol'] > 0 else 0, axis=1)
-        df_wh.to_excel(writer, sheet_name='warehouse', index=False)
-
-        # destination
-        a = df_combine[['dest', 'dest_name', 'dest_lat', 'dest_long', 'prod', 'demand_vol']].drop_duplicates(
-        ).groupby(['dest', 'dest_name', 'dest_lat', 'dest_long']).sum().reset_index()
-        b = df_combine[['dest', 'vol']].groupby(['dest']).sum().rename(columns={'vol': 'dest_vol'}).reset_index()
-        df_dest = pd.merge(a, b, on='dest', how='left')
-        df_dest.to_excel(writer, sheet_name='destination', index=False)
-
-        # transportation
-        df_trans = df_combine.copy()
-        df_trans['trans_vol'] = df_trans['vol']
-        df_trans['trans_rev'] = df_trans['vol'] * df_trans['sell_price']
-        df_trans['trans_vc'] = df_trans['vol'] * (df_trans['var_cost'] + df_trans['trans_cost'])
-        df_trans['trans_netcon'] = df_trans['trans_rev'] - df_trans['trans_vc']
-        df_trans = df_trans[['supply', 'supply_name', 'supply_lat', 'supply_long',
-                             'prod', 'prod_name', 'route', 'route_name', 'wh', 'wh_name',
-                             'dest', 'dest_name', 'dest_lat', 'dest_long',
-                             'trans_vol', 'trans_rev', 'trans_vc', 'trans_netcon']]
-        df_trans.to_excel(writer, sheet_name='trans', index=False)
-
-        writer.save()
+        # supply, warehouse and destination in transportation lanes only
+        lanes = self.df_dict['output_combine']
+        mod.write_df_to_worksheet(rollup['route'], 'route', workbook)
+        df_supply = rollup['supply']
+        mod.write_df_to_worksheet(df_supply[df_supply['supply'].isin(lanes['supply'])], 'supply', workbook)
+        df_wh = rollup['warehouse']
+        mod.write_df_to_worksheet(df_wh[df_wh['wh'].isin(lanes['wh'])], 'warehouse', workbook)
+        df_dest = rollup['destination']
+        mod.write_df_to_worksheet(df_dest[df_dest['dest'].isin(lanes['dest'])], 'destination', workbook)
+        mod.write_df_to_worksheet(rollup['trans'], 'trans', workbook, plot_trans_col)
+        sheet_status.update(save_companion(rollup['trans'], 'trans', p.config['file']['plot'], plot_trans_col))
+
+        # drill-down of each supply
+        for sheet in ['supply_product', 'supply_route', 'supply_center']:
+            mod.write_df_to_worksheet(rollup[sheet], sheet, workbook)
+            sheet_status.update(save_companion(rollup[sheet], sheet, p.config['file']['plot']))
+
+        # write sheet status to workbook
+        t = mod.timed(opt_status, 'time_plot_sec', t)
+        sheet_status['time_plot_sec'] = opt_status['time_plot_sec']
+        mod.write_dict_to_worksheet(sheet_status, 'status', workbook)
+
+        workbook.close()
         plot_file.seek(0)
         p.savefile(plot_file, p.config['file']['plot'])
+        mod.timed(opt_status, 'time_plot_save_sec', t)
 
     def gen_output(self, opt_status):
-        output_file = io.BytesIO()
-        writer = pd.ExcelWriter(output_file, engine='xlsxwriter')
+        rollup = self.rollup(opt_status)
+        t = time.time()
+        output_file = p.tempfile()
+        workbook = mod.workbook(output_file)
 
-        # write sheet status to workbook
-        sheet_status = mod.read_dict_from_worksheet(p.loadfile(p.config['file']['input']), 'status', self.stream)
+        # sheet status, written last with time of output generation
+        sheet_status = self.upload_status()
         sheet_status.update(opt_status)
         sheet_status['output_datetime'] = datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
 
-        # transportation
-        df_trans = self.df_dict['output_combine'].copy()
-        df_trans['trans_vol'] = df_trans['vol']
-        df_trans['trans_rev'] = df_trans['vol'] * df_trans['sell_price']
-        df_trans['trans_vc'] = df_trans['vol'] * (df_trans['var_cost'] + df_trans['trans_cost'])
-        df_trans['trans_netcon'] = df_trans['trans_rev'] - df_trans['trans_vc']
-        df_trans = df_trans[['supply', 'supply_name', 'prod', 'prod_name', 'route', 'route_name', 
-                             'wh', 'wh_name', 'dest', 'dest_name', 
-                             'sell_price', 'var_cost', 'trans_cost',
-                             'trans_vol', 'trans_rev', 'trans_vc', 'trans_netcon']]
-
-        # supply
-        a = self.df_dict['supply']
-        b = self.df_dict['supply_param']
-        c = self.df_dict['output_combine'][['supply', 'prod',
-                                            'sell_price', 'var_cost', 'trans_cost', 'vol']]
-        df_supply = pd.merge(a, b, on='supply', how='left')
-        df_supply = pd.merge(df_supply, c, on='supply', how='left')
-        df_supply['supply_vol'] = df_supply['vol'].fillna(0)
-        df_supply['supply_netcon'] = df_supply.apply(lambda x: x['supply_vol'] * (x['sell_price']-x['var_cost']-x['trans_cost']), axis=1)
-        df_supply = df_supply.groupby(['supply', 'supply_name', 'supply_cap',
-                                       'supply_min', 'supply_max', 'supply_min_vol', 'supply_max_vol'], as_index=False).agg({'supply_vol': 'sum', 'supply_netcon': 'sum', 'prod': 'nunique'}).rename(columns={'prod': 'supply_sku'})
-        df_supply['supply_utilize'] = df_supply['supply_vol'] / df_supply['supply_cap']
-        df_supply['supply_utilize'] = df_supply['supply_utilize'].fillna(0)
-        df_supply['supply_netconperunit'] = df_supply['supply_netcon'] / df_supply['supply_vol']
-        df_supply['supply_netconperunit'] = df_supply['supply_netconperunit'].fillna(0)
-
-        # warehouse
-        a = self.df_dict['warehouse']
-        b = self.df_dict['warehouse_param']
-        c = self.df_dict['output_combine'][['wh', 'vol']]
-        df_wh = pd.merge(a, b, on='wh', how='left')
-        df_wh = pd.merge(df_wh, c, on='wh', how='left')
-        df_wh['wh_vol'] = df_wh['vol'].fillna(0)
-        df_wh = df_wh.groupby(['wh', 'wh_name', 'wh_fc', 'wh_min_vol', 'wh_max_vol'], as_index=False).agg({'wh_vol': 'sum'})
-        df_wh['wh_fc_val'] = df_wh.apply(lambda x: x['wh_fc'] if x['wh_vol'] > 0 else 0, axis=1)
-
-        # destination
-        a = self.df_dict['destination']
-        b = self.df_dict['demand_param']
-        c = self.df_dict['output_combine'][['prod', 'dest', 'vol']]
-        df_dest = pd.merge(a, b, on='dest', how='left')
-        df_dest = df_dest.groupby(['dest', 'dest_name'], as_index=False).agg({'demand_vol': 'sum'})
-        df_dest = pd.merge(df_dest, c, on='dest', how='left')
-        df_dest['dest_vol'] = df_dest['vol'].fillna(0)
-        df_dest = df_dest.groupby(['dest', 'dest_name', 'demand_vol'], as_index=False).agg({'dest_vol': 'sum'})
-
-        # total net contribution
-        total_rev = np.sum(df_trans['trans_rev'])
-        total_fc = np.sum(df_wh['wh_fc_val'])
-        total_vc = np.sum(df_trans['trans_vc'])
-        total_netcon = total_rev - (total_fc + total_vc)
-        sum_netcon = {'Net Contribution': total_netcon,
-                      'Revenue': total_rev,
-                      'Variable Cost': total_vc,
-                      'Fixed Cost': total_fc}
-
         # write sheet
-        mod.write_dict_to_worksheet(sheet_status, 'status', writer.book)
-        mod.write_dict_to_worksheet(sum_netcon, 'summary', writer.book)
-        df_trans.to_excel(writer, sheet_name='trans', index=False)
-        df_supply.to_excel(writer, sheet_name='supply', index=False)
-        df_wh.to_excel(writer, sheet_name='warehouse', index=False)
-        df_dest.to_excel(writer, sheet_name='destination', index=False)
-
-        writer.save()
+        mod.write_dict_to_worksheet(rollup['summary'], 'summary', workbook)
+        mod.write_df_to_worksheet(rollup['trans'], 'trans', workbook, output_trans_col)
+        sheet_status.update(save_companion(rollup['trans'], 'trans', p.config['file']['output'], output_trans_col))
+        mod.write_df_to_worksheet(rollup['supply'], 'supply', workbook, output_supply_col)
+        mod.write_df_to_worksheet(rollup['warehouse'], 'warehouse', workbook)
+        mod.write_df_to_worksheet(rollup['destination'], 'destination', workbook, output_dest_col)
+
+        # write sheet status to workbook
+        t = mod.timed(opt_status, 'time_output_sec', t)
+        sheet_status['time_output_sec'] = opt_status['time_output_sec']
+        mod.write_dict_to_worksheet(sheet_status, 'status', workbook)
+
+        # closing workbook flushes sheets to file, timed with upload after status is written
+        workbook.close()
         output_file.seek(0)
         p.savefile(output_file, p.config['file']['output'])
+        mod.timed(opt_status, 'time_output_save_sec', t)
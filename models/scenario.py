@@ -0,0 +1,114 @@
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from pytz import timezone
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyomo
+
+from models import optimize
+import mod
+
+p = mod.PathFile()
+scenario_config = p.config.get('scenario', {})
+scenario_worker = scenario_config.get('worker', 2)
+# model built once in each worker process from base data, reused by every scenario
+worker = {}
+
+
+def apply_scenario(df_dict, rows):
+    # scale param columns of sheets by factor and recompute derived tables
+    df_dict = {k: v.copy() for k, v in df_dict.items()}
+    for sheet, col, factor in zip(rows['sheet'], rows['column'], rows['factor']):
+        df_dict[sheet][col] = df_dict[sheet][col] * factor
+    return optimize.prepare_data(df_dict)
+
+
+def kpi(df_dict, df_output):
+    # total volume, revenue, cost and net contribution of solution
+    df = pd.merge(df_dict['supplychain_param'], df_output, on=optimize.id_trans, how='left')
+    df['vol'] = df['vol'].fillna(0)
+    wh_vol = df.groupby('wh')['vol'].sum()
+    df_wh = df_dict['warehouse_param']
+    total = {}
+    total['total_vol'] = df['vol'].sum()
+    total['total_rev'] = np.sum(df['vol'] * df['sell_price'])
+    total['total_vc'] = np.sum(df['vol'] * (df['var_cost'] + df['trans_cost']))
+    total['total_fc'] = df_wh.loc[df_wh['wh'].isin(wh_vol[wh_vol > 0].index), 'wh_fc'].sum()
+    total['total_netcon'] = total['total_rev'] - (total['total_fc'] + total['total_vc'])
+    total['total_wh'] = int(np.sum(wh_vol > 0))
+    return total
+
+
+def init_worker(df_dict, solve_engine, options):
+    worker['df_dict'] = df_dict
+    worker['options'] = options
+    # highs instance is built from matrix by first scenario of worker and changed in place by the next ones
+    if solve_engine != 'highs':
+        worker['model'] = optimize.build_model(df_dict)
+
+
+def solve(name, rows, solve_engine):
+    # swap params of worker model, rebuild only when scenario changes lanes of model
+    start_time = time.time()
+    df_dict = apply_scenario(worker['df_dict'], rows)
+    if solve_engine == 'highs':
+        solver_status, termination_condition, df_output, _, reuse, gap = optimize.solve_data(
+            df_dict, [], 'matrix', solve_engine, None, user='scenario', options=worker['options'])
+    else:
+        model = worker['model']
+        reuse = optimize.update_model(model, df_dict)
+        if not reuse:
+            model = optimize.build_model(df_dict)
+        # clear solution of previous scenario
+        for x in model.component_data_objects(pyomo.Var):
+            x.value = None
+        solver_status, termination_condition, gap = optimize.solve_model(
+            model, solve_engine, optimize.solver_executable(solve_engine), options=worker['options'])
+        df_output = optimize.model_output(model)
+    result = {'scenario': name,
+              'solver_status': solver_status,
+              'termination_condition': termination_condition,
+              'gap': gap,
+              'model_reuse': 'yes' if reuse else 'no'}
+    # kpi of optimal solution or of incumbent when solve is stopped by limit
+    if df_output['vol'].notna().all():
+        result.update(kpi(df_dict, df_output))
+    result['solvetime_sec'] = round(time.time() - start_time, 2)
+    return result
+
+
+def run(user, solve_engine='cbc', profile=None):
+    # solve base data and each scenario of input file in process pool, save comparison to scenario file
+    p.setuser(user)
+    opt = optimize.Optimize(user)
+    opt.import_data()
+    df_dict = {k: v for k, v in opt.df_dict.items() if k != 'scenario'}
+    df_scenario = opt.df_dict.get('scenario', pd.DataFrame(columns=optimize.scenario_col))
+    scenario = [('base', df_scenario.iloc[:0])] + list(df_scenario.groupby('scenario', sort=False))
+    status = {}
+    status['scenario_start_time'] = datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=scenario_worker, initializer=init_worker,
+                             initargs=(df_dict, solve_engine, optimize.solver_options(solve_engine, profile))) as executor:
+        result = list(executor.map(solve, [x[0] for x in scenario], [x[1] for x in scenario],
+                                   [solve_engine] * len(scenario)))
+    status['scenario_end_time'] = datetime.datetime.now(timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+    status['scenario_solvetime_sec'] = round(time.time() - start_time, 2)
+    status['scenario_solver_engine'] = solve_engine
+    status['scenario_profile'] = profile if profile in optimize.solver_profile else 'default'
+    status['scenario_count'] = len(scenario)
+
+    # write comparison, one row per scenario with its overrides
+    scenario_file = p.tempfile()
+    workbook = mod.workbook(scenario_file)
+    mod.write_dict_to_worksheet(status, 'status', workbook)
+    df_result = pd.DataFrame(result)
+    df_result.insert(1, 'override', ['; '.join('%s.%s x %s' % x for x in zip(rows['sheet'], rows['column'], rows['factor']))
+                                     for _, rows in scenario])
+    mod.write_df_to_worksheet(df_result, 'scenario', workbook)
+    workbook.close()
+    scenario_file.seek(0)
+    p.savefile(scenario_file, p.config['file']['scenario'])
+    return status
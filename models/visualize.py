@@ -1,12 +1,74 @@
+import re
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 import dash_table
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from models import optimize
 import mod
 
 p = mod.PathFile()
+# loaded plot file of each user with its version, least recently used is dropped over cache_size users
+viz_cache = OrderedDict()
+viz_cache_size = p.config.get('visualize', {}).get('cache_size', 20)
+viz_lock = threading.Lock()
+# optional limit of routes drawn on route map
+route_top = p.config.get('visualize', {}).get('route_top')
+route_min_vol = p.config.get('visualize', {}).get('route_min_vol')
+# drill-down tables, paged, sorted and filtered on server
+table_col = {'product': ['prod', 'prod_name', 'trans_vol'],
+             'route': ['route_name', 'wh_name', 'dest_name', 'trans_vol']}
+table_size = p.config.get('visualize', {}).get('page_size', 5)
+# operator of datatable filter query and its aliases
+filter_op = {'ge': 'ge', '>=': 'ge', 'le': 'le', '<=': 'le', 'lt': 'lt', '<': 'lt', 'gt': 'gt', '>': 'gt',
+             'ne': 'ne', '!=': 'ne', 'eq': 'eq', '=': 'eq', 'contains': 'contains'}
+
+
+def group_offset(df, col):
+    # start and end row of each value of col in df sorted by col
+    keys = df[col].values
+    change = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    start = np.concatenate([[0], change]).astype(int)
+    end = np.concatenate([change, [len(keys)]]).astype(int)
+    return {keys[a]: (a, b) for a, b in zip(start, end)} if len(keys) > 0 else {}
+
+
+def split_filter(part):
+    # column, operator and value of one part of datatable filter query, operator is read right after {column}
+    match = re.match(r'\s*\{(.+?)\}\s*(>=|<=|!=|<|>|=|\S+)\s*(.*)', part)
+    if match is None or match.group(2) not in filter_op:
+        return None, None, None
+    name, op, value = match.group(1), filter_op[match.group(2)], match.group(3).strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in ("'", '"', '`'):
+        value = value[1:-1].replace('\\' + value[0], value[0])
+    else:
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    return name, op, value
+
+
+def page_table(df, page_current, page_size, sort_by, filter_query):
+    # filter, sort and return records of current page only
+    for part in (filter_query or '').split(' && '):
+        name, op, value = split_filter(part)
+        if name not in df.columns:
+            continue
+        if op == 'contains':
+            df = df[df[name].astype(str).str.contains(str(value), regex=False)]
+        elif op in ['eq', 'ne'] and isinstance(value, str):
+            df = df[(df[name].astype(str) == value) == (op == 'eq')]
+        elif op in ['eq', 'ne', 'lt', 'le', 'gt', 'ge']:
+            df = df[getattr(pd.to_numeric(df[name], errors='coerce'), op)(value)]
+    if sort_by:
+        df = df.sort_values([x['column_id'] for x in sort_by], ascending=[x['direction'] == 'asc' for x in sort_by], kind='mergesort')
+    page_current = page_current or 0
+    return df.iloc[page_current * page_size:(page_current + 1) * page_size].to_dict('records')
 
 
 class Visualize:
@@ -14,17 +76,57 @@ class Visualize:
         self.user = user
         p.setuser(self.user)
         self.stream = False if p.config['app']['run'] == 'local' else True
+        # load plot file only when it changed since last load
+        version = p.version(p.config['file']['plot'])
+        with viz_lock:
+            cache = viz_cache.get(self.user)
+            if cache is not None and cache['version'] == version:
+                viz_cache.move_to_end(self.user)
+        if cache is None or cache['version'] != version:
+            cache = {'version': version, 'data': self.load()}
+            with viz_lock:
+                viz_cache[self.user] = cache
+                viz_cache.move_to_end(self.user)
+                while len(viz_cache) > viz_cache_size:
+                    viz_cache.popitem(last=False)
+        self.__dict__.update(cache['data'])
+
+    def load(self):
         try:
-            self.file = p.loadfile(p.config['file']['plot'])
-            self.plot_status = mod.read_dict_from_worksheet(self.file, 'status', self.stream)
-            self.df_route = pd.read_excel(self.file, sheet_name='route')
-            self.df_supply = pd.read_excel(self.file, sheet_name='supply')
-            self.df_warehouse = pd.read_excel(self.file, sheet_name='warehouse')
-            self.df_destination = pd.read_excel(self.file, sheet_name='destination')
-            self.df_trans = pd.read_excel(self.file, sheet_name='trans')
-            self.dict_supply = dict(zip(self.df_supply['supply'], self.df_supply['supply_name']))
+            data = {}
+            data['file'] = p.loadfile(p.config['file']['plot'])
+            data['plot_status'] = mod.read_dict_from_worksheet(data['file'], 'status', self.stream)
+            data['df_route'] = pd.read_excel(data['file'], sheet_name='route')
+            data['df_supply'] = pd.read_excel(data['file'], sheet_name='supply')
+            data['df_warehouse'] = pd.read_excel(data['file'], sheet_name='warehouse')
+            data['df_destination'] = pd.read_excel(data['file'], sheet_name='destination')
+            data['df_trans'] = pd.read_excel(data['file'], sheet_name='trans')
+            data['dict_supply'] = dict(zip(data['df_supply']['supply'], data['df_supply']['supply_name']))
+            # drill-down of each supply from plot file, computed for plot file without it
+            try:
+                rollup = {x: pd.read_excel(data['file'], sheet_name=x) for x in ['supply_product', 'supply_route', 'supply_center']}
+            except Exception:
+                rollup = optimize.supply_rollup(data['df_trans'], data['df_route'])
+            data['df_supplyprod'] = rollup['supply_product']
+            data['df_supplyroute'] = rollup['supply_route']
+            data['offset_supplyprod'] = group_offset(rollup['supply_product'], 'supply')
+            data['offset_supplyroute'] = group_offset(rollup['supply_route'], 'supply')
+            data['offset_route'] = group_offset(data['df_route'], 'supply')
+            data['dict_center'] = dict(zip(rollup['supply_center']['supply'],
+                                           zip(rollup['supply_center']['center_lat'], rollup['supply_center']['center_long'])))
+            # all supply
+            df = rollup['supply_product'].groupby(['prod', 'prod_name'], as_index=False).agg({'trans_vol': 'sum'})
+            data['df_product_all'] = df.sort_values(by='trans_vol', ascending=False).reset_index(drop=True)
+            df = rollup['supply_route'].groupby(['route_name', 'wh_name', 'dest_name'], as_index=False).agg({'trans_vol': 'sum'})
+            data['df_routemap_all'] = df.sort_values(by='trans_vol', ascending=False).reset_index(drop=True)
+            center_lat = list(data['df_destination']['dest_lat'].dropna()) + list(data['df_supply']['supply_lat'].dropna())
+            center_long = list(data['df_destination']['dest_long'].dropna()) + list(data['df_supply']['supply_long'].dropna())
+            data['center_all'] = (np.mean(center_lat), np.mean(center_long))
+            # keep name instead of downloaded content in cache
+            data['file'] = p.config['file']['plot']
         except Exception:
-            self.file = None
+            data = {'file': None}
+        return data
 
     def gen_header(self):
         df_trans = self.df_trans
@@ -48,33 +150,41 @@ class Visualize:
         return supply_txt
 
     @staticmethod
-    def gen_table(df, size=5):
+    def gen_table(table, size=table_size):
         return dash_table.DataTable(
-            columns=[{"name": i, "id": i} for i in df.columns],
-            data=df.to_dict('records'),
-            page_action="native",
+            id='table-%s' % table,
+            columns=[{"name": i, "id": i} for i in table_col[table]],
+            data=[],
+            page_action="custom",
             page_current=0,
             page_size=size,
+            sort_action="custom",
+            sort_mode="single",
+            sort_by=[],
+            filter_action="custom",
+            filter_query="",
         )
 
-    def gen_supplytable(self, click_supply):
+    @staticmethod
+    def select(df, offset, supply):
+        # rows of supply by offset, empty if supply is not in df
+        a, b = offset.get(supply, (0, 0))
+        return df.iloc[a:b].reset_index(drop=True)
+
+    def gen_supplytable(self, click_supply, table):
+        # product or route volume of selected supply
         if click_supply is None or len(click_supply['points'][0]['hovertext'].split('<br>')) <= 1:
-            df_product = self.df_trans.copy()
-            df_route = self.df_trans.copy()
+            df = self.df_product_all if table == 'product' else self.df_routemap_all
         else:
             select_supply = click_supply['points'][0]['hovertext'].split('<br>')[0]
-            df_product = self.df_trans[self.df_trans['supply']
-                                       == select_supply].copy().reset_index()
-            df_route = self.df_trans[self.df_trans['supply'] == select_supply].copy().reset_index()
-        df_product = df_product.groupby(
-            ['prod', 'prod_name'], as_index=False).agg({"trans_vol": "sum"})
-        df_product = df_product.sort_values(
-            by='trans_vol', ascending=False).reset_index(drop=True)
-        df_routemap = df_route.groupby(['route_name', 'wh_name', 'dest_name'],
-                                       as_index=False).agg({"trans_vol": "sum"})
-        df_routemap = df_routemap.sort_values(
-            by='trans_vol', ascending=False).reset_index(drop=True)
-        return self.gen_table(df_product), self.gen_table(df_routemap)
+            if table == 'product':
+                df = self.select(self.df_supplyprod, self.offset_supplyprod, select_supply)
+            else:
+                df = self.select(self.df_supplyroute, self.offset_supplyroute, select_supply)
+        return df[table_col[table]]
+
+    def gen_page(self, click_supply, table, page_current, page_size, sort_by, filter_query):
+        return page_table(self.gen_supplytable(click_supply, table), page_current, page_size, sort_by, filter_query)
 
     def plt_utilization(self):
         df_supply = self.df_supply
@@ -149,36 +259,37 @@ class Visualize:
         ))
 
         if click_supply is None or len(click_supply['points'][0]['hovertext'].split('<br>')) <= 1:
-            center_lat = list(df_destination['dest_lat'].dropna())
-            center_lat.extend(list(df_supply['supply_lat'].dropna()))
-            center_long = list(df_destination['dest_long'].dropna())
-            center_long.extend(list(df_supply['supply_long'].dropna()))
+            center = self.center_all
         else:
             select_supply = click_supply['points'][0]['hovertext'].split('<br>')[0]
-            df_route = df_route[df_route['supply'] == select_supply].reset_index()
-            for i in range(len(df_route)):
-                fig.add_trace(
-                    go.Scattermapbox(
-                        lat=[df_route['supply_lat'][i], df_route['dest_lat'][i]],
-                        lon=[df_route['supply_long'][i], df_route['dest_long'][i]],
-                        mode='lines',
-                        line=dict(width=1, color='black'),
-                        # opacity=float(plt_route['route_vol'][i]) / float(plt_route['route_vol'].max()),
-                        name="%s --> %s: %.0f" % (df_route['supply_name'][i],
-                                                  df_route['dest_name'][i], df_route['route_vol'][i]),
-                        showlegend=False,
-                    )
+            df_route = self.select(df_route, self.offset_route, select_supply)
+            # keep largest routes only when route_top or route_min_vol is set
+            if route_min_vol is not None:
+                df_route = df_route[df_route['route_vol'] >= route_min_vol]
+            if route_top is not None:
+                df_route = df_route.nlargest(route_top, 'route_vol')
+            # all routes in one trace, lines are separated by None
+            gap = [None] * len(df_route)
+            hover = ["%s --> %s: %.0f" % x for x in zip(df_route['supply_name'], df_route['dest_name'], df_route['route_vol'])]
+            fig.add_trace(
+                go.Scattermapbox(
+                    lat=[v for x in zip(df_route['supply_lat'], df_route['dest_lat'], gap) for v in x],
+                    lon=[v for x in zip(df_route['supply_long'], df_route['dest_long'], gap) for v in x],
+                    mode='lines',
+                    line=dict(width=1, color='black'),
+                    hovertext=[v for x in zip(hover, hover, gap) for v in x],
+                    hoverinfo='text',
+                    name="route",
+                    showlegend=False,
                 )
-            center_lat = list(df_route['dest_lat'].dropna())
-            center_lat.extend(list(df_route['supply_lat'].dropna()))
-            center_long = list(df_route['dest_long'].dropna())
-            center_long.extend(list(df_route['supply_long'].dropna()))
+            )
+            center = self.dict_center.get(select_supply, (np.nan, np.nan))
         fig.update_layout(
             title_text='Route Map',
             showlegend=True,
             # legend_orientation="h",
             mapbox_style="carto-positron",
             mapbox_zoom=5,
-            mapbox_center={"lat": np.mean(center_lat), "lon": np.mean(center_long)}
+            mapbox_center={"lat": center[0], "lon": center[1]}
         )
         return fig
@@ -16,6 +16,7 @@ def set_callbacks(app):
             filename = "input_template.xlsx"
             pathfile = os.path.join(os.getcwd(), "models", filename)
         else:
+            # path of local file or opened file from gcp cache, sent in chunks
             filename = p.config['file'][file]
             pathfile = p.loadfile(filename)
         return send_file(pathfile,
@@ -24,18 +24,30 @@ Validate
 
 Solve
 - Select solver engine (default is CBC)
+- Select solver profile of config with thread, time limit, gap and node limit (default solves to optimal without limit)
 - Press solve button to solve the problem
+- Solving runs in background, job status (queued/running/done) refreshes automatically
 - Check solving status
   - Status refer to solver status ('ok' = complete)
-  - Condition refer to termination condition ('optimal' = solution is optimal)
+  - Condition refer to termination condition ('optimal' = solution is optimal), solver profile and relative gap of solution to best bound
+  - Solve stopped by limit of profile exports the best solution found with its gap
   - Please find reference [here](http://www.pyomo.org/blog/2015/1/8/accessing-solver)
+  - Model refer to model size (variables, binaries, constraints, nonzeros) and peak memory of this solve, largest of job process and processes solving regions of decomposed network (solve) or of job process since it started (process) when peak cannot be reset
+  - Phase time refer to time of each step (parse, merge, load, param, component, constraint, solver write, solver run, result load, rollup, output, output save, plot, plot save), output and plot save include closing workbook and saving file
 - Download output file
 
+Scenario
+- Add optional sheet "scenario" with columns scenario, sheet, column, factor
+  - Each row scales a parameter column of a sheet by factor, rows with the same scenario name are applied together
+- Press scenario button to solve base data and all scenarios in background
+- Download scenario file to compare total volume, revenue, cost and net contribution of each scenario
+
 ### Visualization
 - Press refresh to refresh the latest output
 - Check details of the file
 - Click on supply chart (bar chart) to filter all pages by selected supply
 - Click other area in supply chart to reset
+- Sort product and route tables by column header, filter by typing in the row under header (e.g. > 100, W1)
 
 # REFERENCE
 
@@ -1,13 +1,13 @@
-import base64
 import datetime
 
 from pytz import timezone
+import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
 from flask import request
 
-from models import optimize
+from models import optimize, job
 import mod
 
 # get config data
@@ -54,19 +54,33 @@ validate_col = html.Div([
 solve_col = html.Div([
     html.H3('Solve ', style={'display': 'inline-block', 'padding-right': '15px'}),
     html.Button(id='solve', children='Solve'),
+    html.Button(id='scenario', children='Scenario', style={'display': 'none'}),
     dcc.RadioItems(
         id='solver-engine',
-        options=[{'label': 'CBC', 'value': 'cbc'}, {'label': 'GLPK', 'value': 'glpk'}, ],
+        options=[{'label': 'CBC', 'value': 'cbc'}, {'label': 'GLPK', 'value': 'glpk'}, {'label': 'HiGHS', 'value': 'highs'}, ],
         value='cbc',
         labelStyle={'display': 'inline-block'},
         style={'margin-top': '0px'}
     ),
+    # solver option profiles of config, default solves to optimal without limit
+    dcc.RadioItems(
+        id='solver-profile',
+        options=[{'label': x, 'value': x} for x in ['default'] + [x for x in optimize.solver_profile if x != 'default']],
+        value='default',
+        labelStyle={'display': 'inline-block'},
+        style={'margin-top': '0px'}
+    ),
+    dcc.Interval(id='solve-interval', interval=job.job_config.get('interval', 5000), disabled=True),
+    html.P(id='optimize-job'),
     html.P(id='optimize-start'),
     html.P(id='optimize-end'),
     html.P(id='optimize-total'),
     html.P(id='optimize-status'),
     html.P(id='optimize-condition'),
+    html.P(id='optimize-model'),
+    html.P(id='optimize-phase'),
     html.P(html.A('download output', href="/download/output", id='output')),
+    html.P(html.A('download scenario', href="/download/scenario", id='scenario-output')),
 ],
     style={'width': '30%', 'display': 'inline-block', 'vertical-align': 'top'},
 )
@@ -92,7 +106,8 @@ def set_callbacks(app):
                    Output('validate-sheet', 'children'),
                    Output('validate-feas', 'children'),
                    Output('error', 'style'),
-                   Output('solve', 'style'), ],
+                   Output('solve', 'style'),
+                   Output('scenario', 'style'), ],
                   [Input('upload-data', 'contents')],
                   [State('upload-data', 'filename')])
     def start_optimize(content, filename):
@@ -111,6 +126,7 @@ def set_callbacks(app):
             validate_feas_txt = ""
             error_style = {'display': 'none'}
             solve_style = {'display': 'none'}
+            scenario_style = {'display': 'none'}
         # upload file with wrong format
         elif filename[-5:] != ".xlsx" and filename[-4:] != ".xls":
             upload_user_txt = user
@@ -122,6 +138,7 @@ def set_callbacks(app):
             validate_feas_txt = ""
             error_style = {'display': 'none'}
             solve_style = {'display': 'none'}
+            scenario_style = {'display': 'none'}
         else:
             upload_user_txt = user
             upload_ip_txt = str(request.remote_addr)
@@ -132,8 +149,7 @@ def set_callbacks(app):
                 request.remote_addr), 'upload_filename': filename, 'upload_datetime': upload_datetime}
             # get content from upload file and validate sheet
             content_type, content_string = content.split(',')
-            decoded = base64.b64decode(content_string)
-            validate_sheet_status = opt.validate_sheet(decoded, upload_status)
+            validate_sheet_status = opt.validate_sheet(content_string, upload_status)
             if sum([x['error'] for x in validate_sheet_status.values()]) > 0:
                 validate_sheet_error = [(i, {'column': v['column'], 'master': v['master'], 'duplicate': v['duplicate']})
                                         for i, v in validate_sheet_status.items() if validate_sheet_status[i]['error'] > 0]
@@ -141,6 +157,7 @@ def set_callbacks(app):
                 validate_feas_txt = ""
                 error_style = {'display': 'none'}
                 solve_style = {'display': 'none'}
+                scenario_style = {'display': 'none'}
             else:
                 validate_sheet_txt = "PASS"
                 # validate feasible
@@ -151,10 +168,13 @@ def set_callbacks(app):
                     validate_feas_txt = "ERROR - " + str(validate_feas_error)
                     error_style = {'display': 'inline'}
                     solve_style = {'display': 'none'}
+                    scenario_style = {'display': 'none'}
                 else:
                     validate_feas_txt = "PASS"
                     error_style = {'display': 'inline'}
                     solve_style = {'display': 'inline'}
+                    # scenario button only when input has scenario sheet
+                    scenario_style = {'display': 'inline' if 'scenario' in opt.df_dict else 'none'}
         upload_user_txt = "User: " + upload_user_txt
         upload_ip_txt = "IP Address: " + upload_ip_txt
         upload_filename_txt = "Filename: " + upload_filename_txt
@@ -162,40 +182,77 @@ def set_callbacks(app):
         upload_filetype_txt = "File Format: " + upload_filetype_txt
         validate_sheet_txt = "- Sheet: " + validate_sheet_txt
         validate_feas_txt = "- Feasible: " + validate_feas_txt
-        return upload_user_txt, upload_ip_txt, upload_filename_txt, upload_datetime_txt, upload_filetype_txt, validate_sheet_txt, validate_feas_txt, error_style, solve_style
+        return upload_user_txt, upload_ip_txt, upload_filename_txt, upload_datetime_txt, upload_filetype_txt, validate_sheet_txt, validate_feas_txt, error_style, solve_style, scenario_style
 
-    @app.callback([Output('optimize-start', 'children'),
+    @app.callback([Output('optimize-job', 'children'),
+                   Output('optimize-start', 'children'),
                    Output('optimize-end', 'children'),
                    Output('optimize-total', 'children'),
                    Output('optimize-status', 'children'),
                    Output('optimize-condition', 'children'),
-                   Output('output', 'style'), ],
+                   Output('optimize-model', 'children'),
+                   Output('optimize-phase', 'children'),
+                   Output('output', 'style'),
+                   Output('scenario-output', 'style'),
+                   Output('solve-interval', 'disabled'), ],
                   [Input('solve', 'n_clicks'),
-                   Input('solver-engine', 'value')],)
-    def solve(click, solver_engine):
+                   Input('scenario', 'n_clicks'),
+                   Input('solve-interval', 'n_intervals')],
+                  [State('solver-engine', 'value'),
+                   State('solver-profile', 'value')])
+    def solve(click, scenario_click, interval, solver_engine, solver_profile):
         user = request.authorization['username']
-        if click is None:
-            optimize_start_txt = ""
-            optimize_end_txt = ""
-            optimize_total_txt = ""
-            optimize_status_txt = ""
-            optimize_condition_txt = ""
-            output_style = {'display': 'none'}
+        # submit solve or scenario job on click, otherwise poll status of the latest job
+        triggered = [x['prop_id'] for x in dash.callback_context.triggered]
+        if 'solve.n_clicks' in triggered and click is not None:
+            job.submit(user, solver_engine, profile=solver_profile)
+        elif 'scenario.n_clicks' in triggered and scenario_click is not None:
+            job.submit(user, solver_engine, kind='scenario', profile=solver_profile)
+        job_status = job.get(user)
+        optimize_start_txt = ""
+        optimize_end_txt = ""
+        optimize_total_txt = ""
+        optimize_status_txt = ""
+        optimize_condition_txt = ""
+        optimize_model_txt = ""
+        optimize_phase_txt = ""
+        output_style = {'display': 'none'}
+        scenario_output_style = {'display': 'none'}
+        interval_disabled = True
+        if job_status is None:
+            optimize_job_txt = ""
+        elif job_status['status'] in job.job_active:
+            optimize_job_txt = "%s (%s)" % (job_status['status'], job_status['submit_time'])
+            interval_disabled = False
+        elif job_status['status'] == 'error':
+            optimize_job_txt = "ERROR - " + job_status['result']['error']
+        elif job_status['kind'] == 'scenario':
+            opt_status = job_status['result']
+            optimize_job_txt = "%s (%s scenarios)" % (job_status['status'], opt_status['scenario_count'])
+            optimize_start_txt = opt_status['scenario_start_time']
+            optimize_end_txt = opt_status['scenario_end_time']
+            optimize_total_txt = str(opt_status['scenario_solvetime_sec'])
+            scenario_output_style = {'display': 'inline'}
         else:
-            opt = optimize.Optimize(user)
-            opt.import_data()
-            opt_status = opt.optimize(solve_engine=solver_engine)
-            opt.gen_output(opt_status)
-            opt.gen_plot(opt_status)
+            opt_status = job_status['result']
+            optimize_job_txt = job_status['status']
             optimize_start_txt = opt_status['optimize_start_time']
             optimize_end_txt = opt_status['optimize_end_time']
             optimize_total_txt = str(opt_status['optimize_solvetime_sec'])
             optimize_status_txt = opt_status['optimize_solver_status']
-            optimize_condition_txt = opt_status['optimize_termination_condition']
+            optimize_condition_txt = "%s (profile %s, gap %s)" % (opt_status['optimize_termination_condition'],
+                                                                  opt_status.get('optimize_profile', 'default'), opt_status.get('optimize_gap'))
+            optimize_model_txt = "%s variables (%s binaries), %s constraints, %s nonzeros, peak memory %s MB (%s)" % (
+                opt_status['model_variables'], opt_status['model_binaries'], opt_status['model_constraints'],
+                opt_status['model_nonzeros'], opt_status['peak_rss_mb'], opt_status.get('peak_rss_scope', 'process'))
+            optimize_phase_txt = ", ".join("%s %s" % (k[5:-4], v) for k, v in opt_status.items() if k.startswith('time_'))
             output_style = {'display': 'inline'}
+        optimize_job_txt = "Job: " + optimize_job_txt
         optimize_start_txt = "Start Time: " + optimize_start_txt
         optimize_end_txt = "End Time: " + optimize_end_txt
         optimize_total_txt = "Total Time(secs): " + optimize_total_txt
         optimize_status_txt = "Status: " + optimize_status_txt
         optimize_condition_txt = "Condition: " + optimize_condition_txt
-        return optimize_start_txt, optimize_end_txt, optimize_total_txt, optimize_status_txt, optimize_condition_txt, output_style
+        optimize_model_txt = "Model: " + optimize_model_txt
+        optimize_phase_txt = "Phase Time(secs): " + optimize_phase_txt
+        return optimize_job_txt, optimize_start_txt, optimize_end_txt, optimize_total_txt, optimize_status_txt, optimize_condition_txt, optimize_model_txt, optimize_phase_txt, output_style, scenario_output_style, interval_disabled
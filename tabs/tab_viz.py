@@ -67,12 +67,12 @@ select_supply = html.Div(children=[
 data_table = html.Div(children=[
     html.Div([
         html.P("Product"),
-        html.Div(id='table-product'),
-    ], style={'width': '40%', 'display': 'inline-block'}),
+        visualize.Visualize.gen_table('product'),
+    ], style={'width': '40%', 'display': 'inline-block', 'vertical-align': 'top'}),
     html.Div([
         html.P("Route"),
-        html.Div(id='table-route'),
-    ], style={'width': '50%', 'display': 'inline-block'})
+        visualize.Visualize.gen_table('route'),
+    ], style={'width': '50%', 'display': 'inline-block', 'vertical-align': 'top'})
 ],)
 
 # invisible data
@@ -125,19 +125,34 @@ def set_callbacks(app):
 
     @app.callback(
         [Output('select-supply', 'children'),
-         Output('table-product', 'children'),
-         Output('table-route', 'children'),
+         Output('table-product', 'page_current'),
+         Output('table-route', 'page_current'),
          Output('route-map', 'figure')],
         [Input('supply-utilization', 'clickData')])
     def update_supply(click):
         viz = visualize.Visualize(request.authorization['username'])
         if viz.file is None:
             supply_txt = "Supply: "
-            table_product = None
-            table_route = None
             fig_routemap = go.Figure()
         else:
             supply_txt = viz.gen_supply(click)
-            table_product, table_route = viz.gen_supplytable(click)
             fig_routemap = viz.plt_routemap(click)
-        return supply_txt, table_product, table_route, fig_routemap
+        return supply_txt, 0, 0, fig_routemap
+
+    # page of drill-down table, sorted and filtered on server
+    def set_table_callback(table):
+        @app.callback(
+            Output('table-%s' % table, 'data'),
+            [Input('supply-utilization', 'clickData'),
+             Input('table-%s' % table, 'page_current'),
+             Input('table-%s' % table, 'page_size'),
+             Input('table-%s' % table, 'sort_by'),
+             Input('table-%s' % table, 'filter_query')])
+        def update_table(click, page_current, page_size, sort_by, filter_query):
+            viz = visualize.Visualize(request.authorization['username'])
+            if viz.file is None:
+                return []
+            return viz.gen_page(click, table, page_current, page_size, sort_by, filter_query)
+
+    for table in visualize.table_col:
+        set_table_callback(table)